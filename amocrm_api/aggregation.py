@@ -0,0 +1,206 @@
+"""
+Streaming grouped aggregation over leads (entities or raw items),
+memory is used only for group keys and fixed size histograms,
+partial aggregations (of partitions) are mergeable.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from math import ceil, log
+
+
+class Histogram:
+    """
+    Mergeable histogram with logarithmic buckets, percentiles are estimated
+    with relative_accuracy (values <= 0 are counted in zero bucket).
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = log(self._gamma)
+        self.buckets = {}  # bucket index: count
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        if value > 0:
+            key = int(ceil(log(value) / self._log_gamma))
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Histograms relative_accuracy mismatch')
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = percent / 100 * (self.count - 1)
+        if rank < self.zero_count:
+            return 0
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+
+
+class _Group:
+    __slots__ = ('count', 'sum', 'histogram')
+
+    def __init__(self, histogram):
+        self.count, self.sum, self.histogram = 0, 0, histogram
+
+
+def _get_pipeline_id(obj):
+    if isinstance(obj, dict):
+        return obj.get('pipeline_id') or (obj.get('pipeline') or {}).get('id')
+    return getattr(obj.pipeline, 'id', None) if obj.pipeline else None
+
+
+def _get_datetime(value):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc) if value else None
+    return value or None
+
+
+def _get_time_bucket(value, bucket):
+    if value is None:
+        return None
+    if bucket == 'day':
+        return value.date()
+    if bucket == 'week':
+        return value.date() - timedelta(days=value.weekday())
+    if bucket == 'month':
+        return value.date().replace(day=1)
+    # bucket in seconds, as utc timestamp of bucket start
+    return int(value.timestamp() // bucket * bucket)
+
+
+class LeadsAggregation:
+    """
+    Grouped counts, sums and percentiles of value (sale by default) over leads,
+    added one by one (entities or raw items from client.raw_objects()).
+    group_by - "pipeline_id", "status_id", "responsible_user_id" or any lead attribute.
+    time_bucket - "day", "week", "month" or seconds for time_field grouping.
+    """
+    def __init__(self, group_by=('pipeline_id', 'status_id'), value='sale',
+                 time_bucket=None, time_field='created_at', percentiles=True,
+                 relative_accuracy=0.01):
+        self.group_by = tuple(group_by)
+        self.value = value
+        self.time_bucket = time_bucket
+        self.time_field = time_field
+        self.percentiles = percentiles
+        self.relative_accuracy = relative_accuracy
+        self.groups = {}  # group key: _Group
+
+    def _get(self, obj, key):
+        if key == 'pipeline_id':
+            return _get_pipeline_id(obj)
+        return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+    def get_key(self, obj):
+        key = tuple(self._get(obj, k) for k in self.group_by)
+        if self.time_bucket:
+            key += (_get_time_bucket(_get_datetime(self._get(obj, self.time_field)),
+                                     self.time_bucket),)
+        return key
+
+    def add(self, obj):
+        key = self.get_key(obj)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = _Group(
+                self.percentiles and Histogram(self.relative_accuracy) or None
+            )
+        value = self._get(obj, self.value) or 0
+        group.count += 1
+        group.sum += value
+        if group.histogram:
+            group.histogram.add(value)
+
+    def extend(self, objs):
+        for obj in objs:
+            self.add(obj)
+        return self
+
+    def merge(self, other):
+        if (other.group_by, other.time_bucket) != (self.group_by, self.time_bucket):
+            raise ValueError('Aggregations grouping mismatch')
+        for key, other_group in other.groups.items():
+            group = self.groups.get(key)
+            if group is None:
+                self.groups[key] = other_group
+                continue
+            group.count += other_group.count
+            group.sum += other_group.sum
+            if group.histogram:
+                group.histogram.merge(other_group.histogram)
+        return self
+
+    def _resolve_names(self, client, row):
+        pipeline = client.pipelines.get(row.get('pipeline_id'))
+        if pipeline:
+            row['pipeline_name'] = pipeline.name
+        if row.get('status_id') is not None:
+            # Statuses 142 and 143 are in every pipeline, but have same name
+            statuses = [p.statuses[row['status_id']] for p in client.pipelines.values()
+                        if (not pipeline or p is pipeline) and row['status_id'] in p.statuses]
+            if statuses:
+                row['status_name'] = statuses[0].name
+
+    def results(self, percentiles=(50, 90, 99), client=None):
+        """
+        Returns list of rows (dicts) sorted by group key,
+        with pipeline and status names resolved through client.pipelines if client passed.
+        """
+        keys = self.group_by + (('time_bucket',) if self.time_bucket else ())
+        rv = []
+        for key, group in sorted(self.groups.items(),
+                                 key=lambda item: tuple((v is None, v) for v in item[0])):
+            row = dict(zip(keys, key), count=group.count, sum=group.sum,
+                       mean=group.sum / group.count)
+            if group.histogram:
+                for percent in percentiles:
+                    row['p%s' % percent] = group.histogram.percentile(percent)
+            if client:
+                self._resolve_names(client, row)
+            rv.append(row)
+        return rv
+
+
+def aggregate_leads(client, aggregation=None, raw=True, partitions=None, workers=4,
+                    **filters):
+    """
+    Aggregates leads matched by filters, with raw=True pages are not loaded to entities.
+    With partitions (status ids) every partition is aggregated in thread
+    and partial aggregations are merged.
+    """
+    aggregation = aggregation or LeadsAggregation()
+
+    def aggregate(filters):
+        rv = LeadsAggregation(aggregation.group_by, aggregation.value,
+                              aggregation.time_bucket, aggregation.time_field,
+                              aggregation.percentiles, aggregation.relative_accuracy)
+        iterator = client.get_leads_iterator(**filters)
+        if raw:
+            with client.raw_objects():
+                return rv.extend(iterator)
+        return rv.extend(iterator)
+
+    if not partitions:
+        return aggregation.merge(aggregate(filters))
+
+    client.ensure_ratelimiter()
+    with ThreadPoolExecutor(workers) as executor:
+        for partial in executor.map(aggregate, (dict(filters, status_id=[status_id])
+                                                for status_id in partitions)):
+            aggregation.merge(partial)
+    return aggregation
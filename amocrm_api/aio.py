@@ -0,0 +1,106 @@
+import asyncio
+from functools import wraps
+
+
+_DONE = object()
+
+
+class _Error:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class AsyncObjectsIterator:
+    """
+    async for wrapper over ObjectsFetchIterator, entities are taken from iterator
+    in executor thread by pages of iterator.cursor_count, so iterator options
+    (max_count, consistent, checkpoint, etc) work same as for sync iteration.
+    At most prefetch_pages pages are buffered, so fetching is paused
+    while consumer is slow (NOTE: iterator checkpoint is called on fetch,
+    so buffered entities are considered consumed).
+    On aclose() (or exiting async with) fetching is stopped, request in progress
+    can't be interrupted, so it's completed in thread and page is dropped.
+    """
+
+    def __init__(self, iterator, prefetch_pages=2, executor=None):
+        self.iterator = iterator
+        self.prefetch_pages = prefetch_pages
+        self.executor = executor
+        self._queue = None
+        self._task = None
+        self._page = []  # reversed current page
+        self._closed = False
+
+    def _fetch_page(self):
+        # Called in executor thread
+        page, count = [], getattr(self.iterator, 'cursor_count', None) or 100
+        while len(page) < count and not self._closed:
+            try:
+                page.append(next(self.iterator))
+            except StopIteration:
+                break
+        return page
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                page = await loop.run_in_executor(self.executor, self._fetch_page)
+                if not page:
+                    break
+                await self._queue.put(page)  # waiting for consumer if buffer is full
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await self._queue.put(_Error(exc))
+            return
+        await self._queue.put(_DONE)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._task is None:
+            if self._closed:
+                raise StopAsyncIteration()
+            self._queue = asyncio.Queue(maxsize=self.prefetch_pages)
+            self._task = asyncio.ensure_future(self._produce())
+
+        while not self._page:
+            if self._closed:
+                raise StopAsyncIteration()
+            page = await self._queue.get()
+            if page is _DONE:
+                await self.aclose()
+                raise StopAsyncIteration()
+            if isinstance(page, _Error):
+                await self.aclose()
+                raise page.exc
+            self._page = list(reversed(page))
+        return self._page.pop()
+
+    async def aclose(self):
+        self._closed = True
+        self._page = []
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if hasattr(self.iterator, 'close'):
+            self.iterator.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+def _get_objects_aiterator(iterator_method):
+    @wraps(iterator_method)
+    def aiterator(self, *args, prefetch_pages=2, executor=None, **kwargs):
+        return AsyncObjectsIterator(iterator_method(self, *args, **kwargs),
+                                    prefetch_pages, executor)
+    return aiterator
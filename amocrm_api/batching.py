@@ -0,0 +1,142 @@
+from collections import defaultdict
+from concurrent.futures import Future
+from threading import Lock, Timer
+
+
+class _Batch:
+    def __init__(self):
+        self.futures = defaultdict(list)  # id: [futures]
+        self.dispatched = False
+
+
+class GetBatcher:
+    """
+    Coalesces single id lookups from concurrent callers (model.get_one(id=...))
+    during window_seconds into one get_<model_plural_name>(id=[...]) request per model.
+    Future result is list of matched entities (empty if not found),
+    callers of the same id get the same entity.
+    """
+
+    def __init__(self, client, window_seconds=0.005, max_batch=250):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._batches = {}  # model_plural_name: _Batch
+        self._lock = Lock()
+
+    def get(self, model_plural_name, id):
+        future = Future()
+        with self._lock:
+            batch = self._batches.get(model_plural_name)
+            if batch is None:
+                batch = self._batches[model_plural_name] = _Batch()
+                timer = Timer(self.window_seconds, self._dispatch, (model_plural_name, batch))
+                timer.daemon = True
+                timer.start()
+            batch.futures[int(id)].append(future)
+            if len(batch.futures) < self.max_batch:
+                return future
+
+        # Dispatching full batch in caller thread without waiting for timer
+        self._dispatch(model_plural_name, batch)
+        return future
+
+    def _dispatch(self, model_plural_name, batch):
+        with self._lock:
+            if batch.dispatched:
+                return
+            batch.dispatched = True
+            if self._batches.get(model_plural_name) is batch:
+                del self._batches[model_plural_name]
+
+        futures = {id: [f for f in futures if f.set_running_or_notify_cancel()]
+                   for id, futures in batch.futures.items()}
+        try:
+            objs = getattr(self.client, 'get_%s' % model_plural_name)(id=list(futures)).data
+        except BaseException as exc:
+            for future in (f for futures_ in futures.values() for f in futures_):
+                future.set_exception(exc)
+            return
+
+        objs_map = defaultdict(list)
+        for obj in objs:
+            objs_map[obj.id].append(obj)
+        for id, futures_ in futures.items():
+            for future in futures_:
+                future.set_result(objs_map[id])
+
+
+class WriteBehindQueue:
+    """
+    Buffers entities save() and delete() and posts them with client.post_objects
+    in batches when max_size entities are buffered, after max_delay_seconds,
+    or on explicit flush().
+    Returns future for every entity, resolved with obj.meta.get('error')
+    (None on success), or with exception if request failed.
+    """
+
+    def __init__(self, client, max_size=250, max_delay_seconds=1):
+        self.client = client
+        self.max_size = max_size
+        self.max_delay_seconds = max_delay_seconds
+        self._save, self._delete = {}, {}  # key: (obj, future)
+        self._timer = None
+        self._lock = Lock()
+        self._flush_lock = Lock()  # to keep order of posted batches
+
+    def _key(self, obj):
+        # Different objects with same id are merged, last one is posted
+        return (obj.__class__, int(obj.id)) if obj.id is not None else id(obj)
+
+    def _put(self, action, obj):
+        with self._lock:
+            buffer = self._save if action == 'save' else self._delete
+            key = self._key(obj)
+            future = buffer[key][1] if key in buffer else Future()
+            buffer[key] = (obj, future)
+
+            size = len(self._save) + len(self._delete)
+            if size < self.max_size:
+                if not self._timer:
+                    self._timer = Timer(self.max_delay_seconds, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return future
+
+        self.flush()
+        return future
+
+    def save(self, obj):
+        return self._put('save', obj)
+
+    def delete(self, obj):
+        if obj.id is None:
+            raise ValueError('No id')
+        return self._put('delete', obj)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                save, delete = self._save, self._delete
+                self._save, self._delete = {}, {}
+            if not (save or delete):
+                return
+
+            items = [item for item in tuple(save.values()) + tuple(delete.values())
+                     if item[1].set_running_or_notify_cancel()]
+            try:
+                self.client.post_objects(
+                    add_or_update=[obj for obj, future in save.values() if future.running()],
+                    delete=[obj for obj, future in delete.values() if future.running()],
+                )
+            except BaseException as exc:
+                for obj, future in items:
+                    future.set_exception(exc)
+                return
+            for obj, future in items:
+                future.set_result(obj.meta.get('error'))
+
+    close = flush
@@ -1,33 +1,58 @@
-from copy import deepcopy
 from datetime import timezone
 from email.utils import format_datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-
+from operator import attrgetter
+from inspect import signature
+from contextlib import contextmanager
+from threading import RLock, local
+from time import monotonic
+from uuid import uuid4
+
+from requests import Response
 from requests_client.client import BaseClient, auth_required
-from requests_client.cursor_fetch import CursorFetchIterator
 from requests_client.exceptions import HTTPError, AuthError, AuthRequired
 from requests_client.utils import resolve_obj_path, utcnow, cached_property
 
 from . import models
+from .iterators import ObjectsFetchIterator
+from .process_pool import ProcessPoolFetchIterator
+from .aio import _get_objects_aiterator
 from .exceptions import AmocrmClientErrorMixin, PostError
 from .constants import LEAD_FILTER_BY_TASKS, ELEMENT_TYPE, NOTE_TYPE, FIELD_TYPE
-from .utils import maybe_qs_list
+from .utils import maybe_qs_list, get_one, chunked, dump_token, range_filter_params
+from .metadata import AccountIndex
+from .parallel import RateLimiter, iterate_concurrently
+from .retry import RetryPolicy
+from .batching import GetBatcher, WriteBehindQueue
+from .custom_fields import rebind_custom_fields
+from .hashing import content_hash
 
 
 def _get_objects_iterator(func, cursor_count=500):
     # NOTE: because of bad amocrm api design, we have offset instead of real cursor ident,
     # so we can't be sure that we're not skipping some entities if some new
     # were added while iteration is in progress
+    model = func.__name__[len('get_'):]
+    func_signature = signature(func)
 
     @wraps(func)
     def iterator(*args, cursor=None, cursor_count=cursor_count, cursor_kwargs={}, **kwargs):
-        def fetch(generator):
-            resp = func(*args, **kwargs, cursor=generator.cursor, cursor_count=cursor_count)
-            generator.has_more = (len(resp.data) >= cursor_count)
-            generator.cursor += len(resp.data)
-            return resp.data
-        return CursorFetchIterator(fetch, cursor=cursor, **cursor_kwargs)
+        # Keyword arguments not accepted by func are ObjectsFetchIterator options
+        # (checkpoint, consistent, process_pool, etc)
+        cursor_kwargs = dict(cursor_kwargs, **{
+            k: kwargs.pop(k) for k in tuple(kwargs) if k not in func_signature.parameters
+        })
+        filters = dict(func_signature.bind_partial(*args, **kwargs).arguments)
+        client = filters.pop('self')
+        if cursor_kwargs.get('process_pool'):
+            iterator_cls = ProcessPoolFetchIterator
+        else:
+            iterator_cls = ObjectsFetchIterator
+            cursor_kwargs.pop('process_pool', None)
+        return iterator_cls(client, model, filters, cursor=cursor,
+                            cursor_count=cursor_count, **cursor_kwargs)
     return iterator
 
 
@@ -49,11 +74,63 @@ class AmocrmClient(BaseClient):
     base_url = 'https://{}.amocrm.ru/api/v2/'
     login_url = 'https://{}.amocrm.ru/private/api/auth.php?type=json'
     _state_attributes = ['cookies']
-
-    def __init__(self, login, hash, subdomain, **kwargs):
+    # Requests per second, shared between threads, 0 disables it.
+    # Not set by default, but concurrent helpers (partitioned scans, search,
+    # mass_delete, etc) set it to concurrent_ratelimit (api allows 7 per second)
+    # https://www.amocrm.ru/developers/content/api/recommendations
+    ratelimit = None
+    concurrent_ratelimit = 7
+    # Temporary errors retry, for POST requests used only if it's safe
+    retry_policy = RetryPolicy()
+    # Custom field (id, code or name) filled with unique marker of added entity,
+    # so on POST retry entities added by request with lost response are found by marker
+    # and not added again. Adding is not retried without it (or if model has no such field)
+    add_marker_field = None
+    # Coalesces concurrent model.get_one(id=...) calls, set True or GetBatcher to enable
+    get_batcher = None
+    # Buffers entity.save() and entity.delete(), set True or WriteBehindQueue to enable.
+    # NOTE: when enabled they return futures instead of raising errors (PostError)
+    write_behind = None
+    # Seconds between account_info reloads to pick up custom fields changes on load/dump,
+    # disabled by default
+    custom_fields_refresh_seconds = None
+    # Minimal seconds between account_info reloads on unknown custom field,
+    # None disables reloading
+    custom_fields_refresh_min_seconds = 60
+    # Skip (with warning) values of custom fields unknown after reload on load,
+    # KeyError is raised by default
+    skip_unknown_custom_fields = False
+    # Load fetched objects to slotted compact entities (see models.CompactEntity)
+    compact_objects = False
+    # Seconds search results are cached per (model, term, filters)
+    search_cache_seconds = 60
+    # Load fetched objects to lazy entities (see models.LazyEntityMixin)
+    lazy_objects = False
+    _account_info_loaded_at = None
+
+    def __init__(self, login, hash, subdomain, ratelimit=None, retry_policy=None,
+                 get_batcher=None, write_behind=None, custom_fields_refresh_seconds=None,
+                 compact_objects=None, lazy_objects=None, **kwargs):
         self.login, self.hash, self.subdomain = login, hash, subdomain
         self.base_url = self.base_url.format(subdomain)
         self.login_url = self.login_url.format(subdomain)
+        self.ratelimit = ratelimit if ratelimit is not None else self.ratelimit
+        self.ratelimiter = self.ratelimit and RateLimiter(self.ratelimit) or None
+        self._ratelimiter_lock = RLock()
+        self.retry_policy = retry_policy if retry_policy is not None else self.retry_policy
+        get_batcher = get_batcher if get_batcher is not None else self.get_batcher
+        self.get_batcher = GetBatcher(self) if get_batcher is True else get_batcher
+        write_behind = write_behind if write_behind is not None else self.write_behind
+        self.write_behind = WriteBehindQueue(self) if write_behind is True else write_behind
+        if custom_fields_refresh_seconds is not None:
+            self.custom_fields_refresh_seconds = custom_fields_refresh_seconds
+        self.compact_objects = (compact_objects if compact_objects is not None
+                                else self.compact_objects)
+        self.lazy_objects = lazy_objects if lazy_objects is not None else self.lazy_objects
+        self._account_info_lock = RLock()
+        self._search_cache = {}  # (model, term, filters): (expires at, raw items)
+        self._search_cache_lock = RLock()
+        self._local = local()
 
         # Binding models to client and creating client.get_*_iterator
         self.models = {}
@@ -63,16 +140,34 @@ class AmocrmClient(BaseClient):
         super().__init__(**kwargs)
 
     def bind_model(self, model):
+        """
+        Binds model class to client, returns it.
+        For model name subclass of default model (with own schema copy) is bound,
+        so default models and custom fields bindings are not shared between clients.
+        """
         if isinstance(model, str):
             model_name = model
-            model = deepcopy(getattr(self, model_name,
-                                     getattr(models, model_name.capitalize())))
+            model = getattr(self, model_name, getattr(models, model_name.capitalize()))
+            model = type(model)(model.__name__, (model,), {
+                '__module__': model.__module__, '__qualname__': model.__qualname__,
+            })
         else:
             model_name = model.model_name
 
         model._client = self
         setattr(self, model_name, model)
         self.models[model_name] = model
+        return model
+
+    def ensure_ratelimiter(self):
+        """
+        Sets ratelimit to concurrent_ratelimit if it's not set,
+        called before making concurrent requests.
+        """
+        with self._ratelimiter_lock:
+            if self.ratelimit is None and self.concurrent_ratelimit:
+                self.ratelimit = self.concurrent_ratelimit
+                self.ratelimiter = RateLimiter(self.ratelimit)
 
     @property
     def auth_ident(self):
@@ -91,7 +186,25 @@ class AmocrmClient(BaseClient):
             self._set_authenticated(data=resp.data)
         return resp
 
+    def request(self, method, *args, retry=None, **kwargs):
+        # POST is not retried by default, because entities may be added on server side
+        # even if response was lost (see _post_objects)
+        retry = (method == 'GET') if retry is None else retry
+        retry_policy = retry and self.retry_policy
+        attempt = 0
+        while True:
+            try:
+                return super().request(method, *args, **kwargs)
+            except Exception as exc:
+                if not (retry_policy and retry_policy.should_retry(exc, attempt)):
+                    raise
+                attempt += 1
+                self.sleep(self.retry_policy.get_wait_seconds(attempt, exc),
+                           log_reason='retry(%s) on error: %r' % (attempt, exc))
+
     def _request(self, method, url, params=None, data=None, **kwargs):
+        if self.ratelimiter:
+            self.ratelimiter.acquire()
         try:
             return super()._send_request(method, url, params=params, data=data,
                                          **kwargs)
@@ -114,15 +227,50 @@ class AmocrmClient(BaseClient):
         return resp
 
     def update_account_info(self):
-        for key in 'account_info users current_user groups pipelines'.split():
+        for key in 'account_info account_index users current_user groups pipelines'.split():
             if key in self.__dict__:
                 del self.__dict__[key]
         self.__dict__['account_info'] = self.get_account_info().data
+        self._account_info_loaded_at = monotonic()
+
+    def refresh_custom_fields(self, max_age_seconds=None):
+        """
+        Reloads account_info and rebinds custom fields of models with changed
+        custom fields metadata, without rebuilding client.
+        Skipped if account_info was loaded less than max_age_seconds ago.
+        Returns changed model plural names.
+        """
+        def is_fresh():
+            loaded_at = self._account_info_loaded_at
+            if max_age_seconds is None or loaded_at is None:
+                return False
+            return monotonic() - loaded_at < max_age_seconds
+
+        if is_fresh():
+            return set()
+        with self._account_info_lock:
+            if is_fresh():  # refreshed by other thread meanwhile
+                return set()
+            old_index = self.account_index
+            self.update_account_info()
+            new_index = self.account_index
+            names = set(old_index.custom_fields) | set(new_index.custom_fields)
+            changed = {name for name in names if (
+                old_index.get_custom_fields(name).by_id != new_index.get_custom_fields(name).by_id
+            )}
+            if changed:
+                rebind_custom_fields(self, changed)
+            return changed
 
     @cached_property
     def account_info(self):
+        self._account_info_loaded_at = monotonic()
         return self.get_account_info().data
 
+    @cached_property
+    def account_index(self):
+        return AccountIndex(self.account_info)
+
     @cached_property
     def users(self):
         return {
@@ -145,6 +293,120 @@ class AmocrmClient(BaseClient):
             for id, data in self.account_info.pipelines.items()
         }
 
+    def get_iterator_from_token(self, token, **kwargs):
+        """
+        Resume iteration from ObjectsFetchIterator.token (or .state)
+        """
+        return ObjectsFetchIterator.from_token(self, token, **kwargs)
+
+    def get_partitioned_iterator(self, model, partition_by='status_id', partitions=None,
+                                 workers=4, queue_size=1000, cursor_count=500, **filters):
+        """
+        Full scan of model entities split into disjoint partitions by filter key,
+        partitions are iterated concurrently (within client ratelimit),
+        entities are yielded in order they were fetched, deduplicated by id.
+        model - model plural name, for example "leads"
+        partition_by - "status_id" (leads only) or "responsible_user_id"
+        partitions - filter values, all pipelines statuses or users by default
+        NOTE: entities of deleted users are not matched by responsible_user_id partitions.
+        """
+        method = getattr(self, 'get_%s' % model)
+        if partition_by not in signature(method).parameters:
+            raise ValueError('%s can\'t be partitioned by %s' % (model, partition_by))
+
+        if partitions is None:
+            if partition_by == 'status_id':
+                partitions = sorted(set(id for pipeline in self.pipelines.values()
+                                        for id in pipeline.statuses))
+            elif partition_by == 'responsible_user_id':
+                partitions = sorted(self.users)
+            else:
+                raise ValueError('partitions required for %s' % partition_by)
+
+        self.ensure_ratelimiter()
+        iterators = (
+            getattr(self, 'get_%s_iterator' % model)(
+                **dict(filters, **{partition_by: value}), cursor_count=cursor_count
+            ) for value in partitions
+        )
+        seen = set()
+        for obj in iterate_concurrently(iterators, workers, queue_size):
+            if obj.id not in seen:
+                seen.add(obj.id)
+                yield obj
+
+    def search(self, model, terms, workers=4, cache_seconds=None, cursor_count=500,
+               **filters):
+        """
+        Searches model entities by many query terms, terms are queried concurrently
+        (within client ratelimit), every term is fetched with all pages.
+        model - model plural name, for example "contacts"
+        Returns {term: entities list}, entity matched by many terms is same object
+        in all lists. Raw results are cached for cache_seconds
+        (search_cache_seconds by default) and loaded to new entities on every call,
+        so entities are not shared between calls.
+        """
+        method = getattr(self, 'get_%s' % model)
+        if 'query' not in signature(method).parameters:
+            raise ValueError('%s can\'t be searched' % model)
+        terms = list(terms)  # may be iterator, iterated many times
+        cache_seconds = cache_seconds if cache_seconds is not None else self.search_cache_seconds
+        filters_key = dump_token(filters)
+
+        rv, now = {}, monotonic()
+        with self._search_cache_lock:
+            for key in [k for k, (expires_at, _) in self._search_cache.items()
+                        if expires_at <= now]:
+                del self._search_cache[key]
+            for term in terms:
+                if (model, term, filters_key) in self._search_cache:
+                    rv[term] = self._search_cache[(model, term, filters_key)][1]
+        missed = [term for term in dict.fromkeys(terms) if term not in rv]
+
+        def search(term):
+            with self.raw_objects():
+                return list(getattr(self, 'get_%s_iterator' % model)(
+                    query=term, cursor_count=cursor_count, **filters
+                ))
+
+        if missed:
+            self.ensure_ratelimiter()
+            with ThreadPoolExecutor(workers) as executor:
+                results = dict(zip(missed, executor.map(search, missed)))
+            expires_at = monotonic() + cache_seconds
+            with self._search_cache_lock:
+                for term, items in results.items():
+                    if cache_seconds:
+                        self._search_cache[(model, term, filters_key)] = (expires_at, items)
+                    rv[term] = items
+
+        # Deduplicating entities fetched by many terms (or cached at different time)
+        items = {item['id']: item for term in terms for item in rv[term]}
+        model = get_one(m for m in self.models.values()
+                        if getattr(m, 'model_plural_name', None) == model)
+        objs = dict(zip(items, self._load_objects(model, list(items.values()))))
+        return {term: [objs[item['id']] for item in rv[term]] for term in terms}
+
+    def get_user(self, id=None, login=None, email=None):
+        return self.users[id if id is not None else
+                          self.account_index.get_user_id(login=login, email=email)]
+
+    def get_status(self, id=None, name=None, pipeline_id=None):
+        pipeline_id, id = get_one(self.account_index.get_status_ids(id, name, pipeline_id))
+        return self.pipelines[pipeline_id].statuses[id]
+
+    @contextmanager
+    def raw_objects(self):
+        """
+        Within context get_* methods called in current thread return raw items
+        without loading them to entities.
+        """
+        prev, self._local.raw_objects = getattr(self._local, 'raw_objects', False), True
+        try:
+            yield
+        finally:
+            self._local.raw_objects = prev
+
     @auth_required
     def _get_objects(self, model, id=[], params={}, query=None, responsible_user_id=None,
                     modified_since=None, cursor=None, cursor_count=500):
@@ -176,17 +438,25 @@ class AmocrmClient(BaseClient):
             # Got "_embedded" key error on "customers"
             resp.data = []
         else:
-            resp.data = resolve_obj_path(resp.data, '_embedded.items')
-            resp.data = model.load(resp.data, many=True)
+            resp.data = self._load_objects(model, resolve_obj_path(resp.data, '_embedded.items'))
         return resp
 
+    def _load_objects(self, model, items):
+        if getattr(self._local, 'raw_objects', False):
+            return items
+        if self.compact_objects:
+            return model.load_compact(items, many=True)
+        if self.lazy_objects:
+            return model.load_lazy(items, many=True)
+        return model.load(items, many=True)
+
     @auth_required
-    def _ajax_delete_objects(self, model, delete_map):
+    def _ajax_delete_objects(self, model, delete_map, retry=None):
         # Actually this is fix for models that can't be deleted using
         # standard api interface (for some reason), but obviously should be
         resp = self.post('/ajax/%s/multiple/delete/' % model.model_plural_name,
                          data=list(('ID[]', id) for id in delete_map),
-                         headers={'X-Requested-With': 'XMLHttpRequest'})
+                         headers={'X-Requested-With': 'XMLHttpRequest'}, retry=retry)
         if isinstance(delete_map, dict):
             # Allowing delete only by id otherwise
             for obj in delete_map.values():
@@ -196,14 +466,131 @@ class AmocrmClient(BaseClient):
                     obj.meta.pop('error', None)
         return resp
 
+    def mass_delete(self, model, ids=None, chunk_size=100, workers=4, delete_all=False,
+                    **filters):
+        """
+        Deletes contacts or leads by ids (or entities, may be iterator) in chunks
+        sent concurrently (within client ratelimit), without loading entities.
+        Without ids entities matched by filters (query, responsible_user_id, etc)
+        are deleted, their ids are collected from raw pages before delete,
+        because deleting shifts offset pagination.
+        Without ids and filters all entities are deleted only with delete_all=True.
+        Returns [(chunk ids, error)], error is None on success,
+        error message or exception otherwise.
+        """
+        if isinstance(model, str):
+            model = get_one(m for m in self.models.values()
+                            if getattr(m, 'model_plural_name', None) == model)
+        if model.model_name not in self.__model_names_ajax_delete:
+            raise ValueError('Mass delete not supported for %s' % model.model_plural_name)
+
+        if ids is None:
+            if not delete_all and all(v in (None, '', [], ()) for v in filters.values()):
+                raise ValueError('ids or filters required (or delete_all=True) to delete %s' %
+                                 model.model_plural_name)
+            iterator = getattr(self, 'get_%s_iterator' % model.model_plural_name)(**filters)
+            with self.raw_objects():
+                ids = [item['id'] for item in iterator]
+
+        def delete(chunk):
+            try:
+                # Retry is safe, deleting is idempotent
+                resp = self._ajax_delete_objects(model, chunk, retry=True)
+            except Exception as exc:
+                return chunk, exc
+            return chunk, (None if resp.data.status == 'success' else resp.data.message)
+
+        self.ensure_ratelimiter()
+        rv, pending = [], deque()
+        with ThreadPoolExecutor(workers) as executor:
+            # Limiting submitted chunks, so ids iterator is consumed as chunks are deleted
+            for chunk in chunked((int(getattr(id, 'id', id)) for id in ids), chunk_size):
+                pending.append(executor.submit(delete, chunk))
+                if len(pending) >= workers * 2:
+                    rv.append(pending.popleft().result())
+            rv.extend(future.result() for future in pending)
+        return rv
+
+    def _get_add_marker_field_id(self, model):
+        if not self.add_marker_field:
+            return None
+        method = getattr(self, 'get_%s' % model.model_plural_name)
+        if 'modified_since' not in signature(method).parameters:
+            return None
+        index = self.account_index.get_custom_fields(model.model_plural_name)
+        for attr in ('id', 'code', 'name'):
+            metas = index.find(attr, self.add_marker_field)
+            if metas:
+                return metas[0]['id'] if len(metas) == 1 else None
+        return None
+
+    def _set_add_markers(self, model, add_data):
+        # Returns markers of added entities data, empty if markers are not supported
+        field_id = add_data and self._get_add_marker_field_id(model)
+        if not field_id:
+            return []
+        markers = [uuid4().hex for _ in add_data]
+        for data, marker in zip(add_data, markers):
+            data['custom_fields'] = [
+                value for value in data.get('custom_fields') or () if value['id'] != field_id
+            ] + [{'id': field_id, 'values': [{'value': marker}]}]
+        return markers
+
+    def _lookup_added(self, model, markers, since):
+        """
+        Returns {add index: id} for entities added by request with lost response,
+        matching add markers of entities modified since request
+        (listed by modified_since, not searched, because search index lags behind writes).
+        """
+        field_id = self._get_add_marker_field_id(model)
+        idxs = {marker: i for i, marker in enumerate(markers)}
+        iterator = getattr(self, 'get_%s_iterator' % model.model_plural_name)
+        rv = {}
+        with self.raw_objects():
+            for item in iterator(modified_since=since):
+                for value in item.get('custom_fields') or ():
+                    if value['id'] == field_id and value['values']:
+                        marker = value['values'][0].get('value')
+                        if marker in idxs:
+                            rv[idxs[marker]] = int(item['id'])
+        return rv
+
     @auth_required
-    def _post_objects(self, model, add, update_map, delete_map):
+    def _post_objects(self, model, add, update_map, delete_map, attempt=0):
         payload = {
             'add': [obj.dump() for obj in add],
             'update': [obj.dump() for obj in update_map.values()],
             'delete': tuple(delete_map.keys()),
         }
-        resp = self.post(model.model_plural_name, json=payload)
+        markers = self._set_add_markers(model, payload['add'])
+        since = utcnow().replace(microsecond=0)
+        try:
+            resp = self.post(model.model_plural_name, json=payload)
+        except Exception as exc:
+            if not (self.retry_policy and self.retry_policy.should_retry(exc, attempt)):
+                raise
+            if add and not markers:
+                # Entities may be added even if response was lost,
+                # and they can't be found to prevent duplicates.
+                raise
+            self.sleep(self.retry_policy.get_wait_seconds(attempt + 1, exc),
+                       log_reason='post retry(%s) on error: %r' % (attempt + 1, exc))
+
+            if add:
+                # Entities added by lost request are not added again.
+                # Update and delete are considered safe to retry.
+                added = self._lookup_added(model, markers, since)
+                for i, id in added.items():
+                    add[i].id = id
+                    add[i].meta.pop('error', None)
+                add = [obj for i, obj in enumerate(add) if i not in added]
+
+                if not (add or update_map or delete_map):
+                    resp = Response()
+                    resp.status_code, resp.data = 200, []
+                    resp.errors = {'add': {}, 'update': {}, 'delete': {}}
+                    return resp
+            return self._post_objects(model, add, update_map, delete_map, attempt + 1)
 
         errors = resolve_obj_path(resp.data, '_embedded.errors', {}) or {}
         # Fixing this PHP array shit
@@ -330,6 +717,43 @@ class AmocrmClient(BaseClient):
             rv.append(resp)
         return rv
 
+    def upsert_objects(self, objs, hash_store, key=None, chunk_size=250, updated_at=True):
+        """
+        Posts (adds or updates) only objects changed since last successful upsert,
+        comparing content hash with stored in hash_store (hashing.HashStore).
+        key - function returning object record key (source database id for example),
+        obj.id by default. Objects without id are updated if they were added
+        by previous upsert with same key.
+        Returns (post_objects responses, skipped objects), hashes of failed objects
+        (with obj.meta['error']) are not stored, so they are posted again next time.
+        """
+        key = key or attrgetter('id')
+        by_model = defaultdict(list)
+        for obj in objs:
+            by_model[obj.model_plural_name].append((key(obj), content_hash(obj), obj))
+
+        rv, skipped = [], []
+        for model, items in by_model.items():
+            stored = hash_store.get_many(model, (k for k, _, _ in items if k is not None))
+            changed = []
+            for k, hash, obj in items:
+                stored_hash, id = stored.get(str(k), (None, None))
+                if obj.id is None and id is not None:
+                    obj.id = id
+                if hash == stored_hash and obj.id == id:
+                    skipped.append(obj)
+                else:
+                    changed.append((k, hash, obj))
+
+            for chunk in chunked(changed, chunk_size):
+                rv.extend(self.post_objects([obj for _, _, obj in chunk], updated_at=updated_at))
+                # Key of added object is known after post if it's obj.id
+                hash_store.set_many(model, (
+                    (k if k is not None else key(obj), hash, obj.id) for k, hash, obj in chunk
+                    if 'error' not in obj.meta and obj.id is not None
+                ))
+        return rv, skipped
+
     def get_contacts(self, id=[], query=None, responsible_user_id=None, modified_since=None,
                      cursor=None, cursor_count=500):
         # https://www.amocrm.ru/developers/content/api/contacts
@@ -340,17 +764,19 @@ class AmocrmClient(BaseClient):
         )
 
     get_contacts_iterator = _get_objects_iterator(get_contacts)
+    get_contacts_aiterator = _get_objects_aiterator(get_contacts_iterator)
 
     def get_leads(self, id=[], status_id=[], datetimes_create=None,
                   datetimes_modify=None, tasks=None, is_active=None,
                   query=None, responsible_user_id=None, modified_since=None,
                   cursor=None, cursor_count=500):
         # https://www.amocrm.ru/developers/content/api/leads
+        # datetimes_create, datetimes_modify - (from, to) datetimes or dates
 
         params = {
             'status': maybe_qs_list(status_id),
-            # 'filter[date_create]': datetimes_create,  # TODO dates or datetimes?
-            # 'filter[date_modify]': datetimes_modify,  # TODO dates or datetimes?
+            **range_filter_params('date_create', datetimes_create),
+            **range_filter_params('date_modify', datetimes_modify),
             'filter[tasks]': tasks and LEAD_FILTER_BY_TASKS(tasks).value or None,
             'filter[active]': 1 if is_active else None,
         }
@@ -360,6 +786,7 @@ class AmocrmClient(BaseClient):
         )
 
     get_leads_iterator = _get_objects_iterator(get_leads)
+    get_leads_aiterator = _get_objects_aiterator(get_leads_iterator)
 
     def get_companies(self, id=[], query=None, responsible_user_id=None,
                       modified_since=None, cursor=None, cursor_count=500):
@@ -371,16 +798,31 @@ class AmocrmClient(BaseClient):
         )
 
     get_companies_iterator = _get_objects_iterator(get_companies)
+    get_companies_aiterator = _get_objects_aiterator(get_companies_iterator)
 
-    def get_customers(self, id=[], cursor=None, cursor_count=500):
+    def get_customers(self, id=[], responsible_user_id=None, datetimes_create=None,
+                      datetimes_modify=None, next_dates=None, cursor=None, cursor_count=500):
         # https://www.amocrm.ru/developers/content/api/customers
-        # TODO: filters not implemented
-
-        return self._get_objects(self.customer, id,
+        # datetimes_create, datetimes_modify, next_dates - (from, to) datetimes or dates
+
+        if datetimes_create and datetimes_modify:
+            raise ValueError('Customers may be filtered only by create or modify dates')
+        if responsible_user_id is not None and not isinstance(responsible_user_id,
+                                                              (list, tuple)):
+            responsible_user_id = [responsible_user_id]
+        date_type = 'create' if datetimes_create else 'modify' if datetimes_modify else None
+        params = {
+            'filter[main_user][]': responsible_user_id,
+            'filter[date][type]': date_type,
+            **range_filter_params('date', datetimes_create or datetimes_modify),
+            **range_filter_params('next_date', next_dates),
+        }
+        return self._get_objects(self.customer, id, params,
             cursor=cursor, cursor_count=cursor_count
         )
 
     get_customers_iterator = _get_objects_iterator(get_customers)
+    get_customers_aiterator = _get_objects_aiterator(get_customers_iterator)
 
     def get_transactions(self, id=[], customer_id=[], cursor=None, cursor_count=500):
         # https://www.amocrm.ru/developers/content/api/customers
@@ -393,6 +835,7 @@ class AmocrmClient(BaseClient):
         )
 
     get_transactions_iterator = _get_objects_iterator(get_transactions)
+    get_transactions_aiterator = _get_objects_aiterator(get_transactions_iterator)
 
     def get_tasks(self, id=[], element_id=[], element_type=None,
                   responsible_user_id=None, cursor=None, cursor_count=500):
@@ -408,6 +851,29 @@ class AmocrmClient(BaseClient):
         )
 
     get_tasks_iterator = _get_objects_iterator(get_tasks)
+    get_tasks_aiterator = _get_objects_aiterator(get_tasks_iterator)
+
+    def get_all_tasks_iterator(self, element_types=(ELEMENT_TYPE.CONTACT, ELEMENT_TYPE.LEAD,
+                                                    ELEMENT_TYPE.COMPANY,
+                                                    ELEMENT_TYPE.CUSTOMER),
+                               order_by_created_at=False, workers=4, queue_size=1000,
+                               **filters):
+        """
+        Tasks of all element types, fetched concurrently and merged into one stream.
+        With order_by_created_at all tasks are fetched and sorted by created_at in memory.
+        NOTE: tasks not linked to any element are not matched, use get_tasks_iterator.
+        """
+        return self._get_element_types_iterator('tasks', element_types, order_by_created_at,
+                                                workers, queue_size, filters)
+
+    def get_tasks_by_elements(self, element_type, element_ids, chunk_size=100, workers=4,
+                              **filters):
+        """
+        Returns {element_id: [tasks]} for many elements,
+        fetched concurrently with chunk_size element ids per request.
+        """
+        return self._get_by_elements('tasks', element_type, element_ids, chunk_size, workers,
+                                     filters)
 
     def get_notes(self, element_type, id=[], element_id=[], note_type=None,
                   modified_since=None, cursor=None, cursor_count=500):
@@ -423,6 +889,55 @@ class AmocrmClient(BaseClient):
         )
 
     get_notes_iterator = _get_objects_iterator(get_notes)
+    get_notes_aiterator = _get_objects_aiterator(get_notes_iterator)
+
+    def _get_element_types_iterator(self, model, element_types, order_by_created_at,
+                                    workers, queue_size, filters):
+        self.ensure_ratelimiter()
+        method = getattr(self, 'get_%s_iterator' % model)
+        iterators = [method(element_type=ELEMENT_TYPE(element_type), **filters)
+                     for element_type in element_types]
+        objs = iterate_concurrently(iterators, workers, queue_size)
+        if not order_by_created_at:
+            return objs
+        # Api order is not guaranteed to be creation order, so sorting explicitly
+        return iter(sorted(objs, key=attrgetter('created_at', 'id')))
+
+    def _get_by_elements(self, model, element_type, element_ids, chunk_size, workers,
+                         filters):
+        self.ensure_ratelimiter()
+        element_ids = list(dict.fromkeys(map(int, element_ids)))
+        method = getattr(self, 'get_%s_iterator' % model)
+        iterators = (
+            method(element_type=ELEMENT_TYPE(element_type),
+                   element_id=element_ids[i:i + chunk_size], **filters)
+            for i in range(0, len(element_ids), chunk_size)
+        )
+        rv = {id: [] for id in element_ids}
+        # Entities of one element are from one chunk, so order is kept
+        for obj in iterate_concurrently(iterators, workers):
+            rv.setdefault(obj.element_id, []).append(obj)
+        return rv
+
+    def get_all_notes_iterator(self, element_types=tuple(ELEMENT_TYPE), note_type=None,
+                               order_by_created_at=False, workers=4, queue_size=1000,
+                               **filters):
+        """
+        Notes of all element types, fetched concurrently and merged into one stream.
+        With order_by_created_at all notes are fetched and sorted by created_at in memory.
+        """
+        return self._get_element_types_iterator('notes', element_types, order_by_created_at,
+                                                workers, queue_size,
+                                                dict(filters, note_type=note_type))
+
+    def get_notes_by_elements(self, element_type, element_ids, note_type=None,
+                              chunk_size=100, workers=4, **filters):
+        """
+        Returns {element_id: [notes]} for many elements,
+        fetched concurrently with chunk_size element ids per request.
+        """
+        return self._get_by_elements('notes', element_type, element_ids, chunk_size, workers,
+                                     dict(filters, note_type=note_type))
 
     def get_pipelines(self, id=[]):
         # https://www.amocrm.ru/developers/content/api/pipelines
@@ -0,0 +1,265 @@
+"""
+Columnar export of entities to pandas DataFrame, numpy structured array or arrow Table,
+with custom fields flattened to typed columns.
+pandas, numpy and pyarrow are optional and imported on conversion.
+"""
+from array import array
+from calendar import timegm
+from datetime import datetime
+
+from marshmallow import fields, missing
+
+from .constants import FIELD_TYPE
+from .fields import EntityField, TagsField
+
+
+INT, FLOAT, BOOL, DATETIME, OBJECT = 'int', 'float', 'bool', 'datetime', 'object'
+
+_ARRAY_TYPECODES = {INT: 'q', FLOAT: 'd', BOOL: 'b', DATETIME: 'q'}
+
+_CUSTOM_FIELD_KINDS = {
+    FIELD_TYPE.NUMERIC: INT,
+    FIELD_TYPE.CHECKBOX: BOOL,
+    FIELD_TYPE.DATE: DATETIME,
+    FIELD_TYPE.BIRTHDAY: DATETIME,
+    FIELD_TYPE.MULTISELECT: OBJECT,
+    FIELD_TYPE.SMART_ADDRESS: OBJECT,
+    FIELD_TYPE.legal_entity: OBJECT,
+    FIELD_TYPE.ITEMS: OBJECT,
+}  # text otherwise
+
+
+def _to_timestamp(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp()) if value.tzinfo else timegm(value.timetuple())
+    return timegm(value.timetuple())  # date as utc midnight
+
+
+def _missing_as_none(value):
+    return None if value is missing else value
+
+
+def _ids(value):
+    if not value:
+        return ()
+    return tuple(obj.id for obj in value if obj is not None)
+
+
+class _Column:
+    def __init__(self, name, kind):
+        self.name, self.kind = name, kind
+        if kind in _ARRAY_TYPECODES:
+            self.values, self.mask = array(_ARRAY_TYPECODES[kind]), bytearray()  # 1 is null
+        else:
+            self.values, self.mask = [], None
+
+    def append(self, value):
+        if self.mask is None:
+            self.values.append(value)
+        elif value is None:
+            self.values.append(0)
+            self.mask.append(1)
+        else:
+            if self.kind == DATETIME:
+                value = _to_timestamp(value)
+            self.values.append(value)
+            self.mask.append(0)
+
+    def has_nulls(self):
+        return self.mask is not None and 1 in self.mask
+
+    def get_mask(self):
+        import numpy as np
+        return np.frombuffer(bytes(self.mask), dtype=np.uint8).astype(bool)
+
+
+def _get_field_kind(field):
+    if isinstance(field, fields.DateTime):
+        return DATETIME
+    if isinstance(field, fields.Bool):
+        return BOOL
+    if isinstance(field, fields.Int) or isinstance(getattr(field, 'container', None),
+                                                   fields.Int):
+        return INT
+    if isinstance(field, fields.Number):
+        return FLOAT
+    if isinstance(field, EntityField) and not field.many:
+        return INT
+    return OBJECT
+
+
+class ColumnarBuilder:
+    """
+    Appends entities of model (from get_*_iterator, page by page) to typed column buffers.
+    Single entity links are stored as id columns, many links and tags as tuples.
+    Custom fields are flattened to columns named by binded model field or custom field name,
+    multitext fields (phone, email) to column per enum with values joined by ", ",
+    multiselect values are tuples.
+    """
+
+    def __init__(self, model, columns=None, custom_fields=True):
+        self.model = model
+        self.selected = columns and set(columns)
+        self._getters = []  # (column, getter)
+        self.columns = {}
+
+        has_custom_fields = 'custom_fields' in model.schema.fields
+        if has_custom_fields and model.schema.fields['custom_fields'].custom_fields is None:
+            # Binding before, because binded custom fields are removed from schema
+            model.schema._maybe_bind_custom_fields(None)
+
+        names = sorted(model.schema.fields, key=lambda name: (name != 'id', name))
+        for name in names:
+            field = model.schema.fields[name]
+            if name in ('custom_fields', '_links'):
+                continue
+            kind = _get_field_kind(field)
+            if isinstance(field, EntityField):
+                getter = ((lambda obj, name=name: _ids(getattr(obj, name, None))) if field.many
+                          else (lambda obj, name=name: getattr(getattr(obj, name, None),
+                                                               'id', None)))
+            elif isinstance(field, TagsField):
+                getter = (lambda obj, name=name: tuple(getattr(obj, name, None) or ()))
+            else:
+                getter = (lambda obj, name=name: _missing_as_none(getattr(obj, name, None)))
+            self._add_column(name, kind, getter)
+
+        if custom_fields and has_custom_fields:
+            self._add_custom_fields_columns()
+
+    def _add_column(self, name, kind, getter, group=None):
+        # Column may be selected by name, or by group (custom field name for multitext)
+        if self.selected and not (name in self.selected or group in self.selected):
+            return
+        if name in self.columns:
+            raise ValueError('Duplicated column: %s' % name)
+        self.columns[name] = column = _Column(name, kind)
+        self._getters.append((column, getter))
+
+    def _add_custom_fields_columns(self):
+        custom_fields = self.model.schema.fields['custom_fields'].custom_fields
+        names = {}
+        for id, custom_field in sorted(custom_fields.items()):
+            name = custom_field.name or custom_field.custom_field_meta['name']
+            names.setdefault(name, []).append(id)
+
+        for id, custom_field in sorted(custom_fields.items()):
+            name = custom_field.name or custom_field.custom_field_meta['name']
+            if len(names[name]) > 1 or name in self.columns:
+                name = '%s_%s' % (name, id)
+            field_type = FIELD_TYPE(custom_field.custom_field_meta['field_type'])
+
+            if field_type == FIELD_TYPE.MULTITEXT:
+                for enum in sorted(custom_field.enums):
+                    self._add_column('%s_%s' % (name, enum), OBJECT,
+                                     self._multitext_getter(id, enum), group=name)
+                continue
+
+            kind = _CUSTOM_FIELD_KINDS.get(field_type, OBJECT)
+            if field_type == FIELD_TYPE.MULTISELECT:
+                getter = (lambda obj, id=id: tuple(self._get_custom_field(obj, id) or ()))
+            elif field_type == FIELD_TYPE.SMART_ADDRESS:
+                getter = self._smart_address_getter(id)
+            else:
+                getter = (lambda obj, id=id: self._get_custom_field(obj, id))
+            self._add_column(name, kind, getter)
+
+    @staticmethod
+    def _get_custom_field(obj, id):
+        if not obj.custom_fields:
+            return None
+        return obj.custom_fields.get(id)
+
+    def _multitext_getter(self, id, enum):
+        def getter(obj):
+            value = self._get_custom_field(obj, id)
+            values = value and value.getall(enum, None)
+            return ', '.join(values) if values else None
+        return getter
+
+    def _smart_address_getter(self, id):
+        def getter(obj):
+            value = self._get_custom_field(obj, id)
+            return value.to_dict() if value else None
+        return getter
+
+    def append(self, obj):
+        for column, getter in self._getters:
+            column.append(getter(obj))
+
+    def extend(self, objs):
+        for obj in objs:
+            self.append(obj)
+        return self
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())).values) if self.columns else 0
+
+    def to_numpy(self):
+        """
+        Structured array, int columns with nulls are float with nan,
+        datetimes are datetime64[s] with NaT.
+        """
+        import numpy as np
+
+        dtypes, data = [], []
+        for column in self.columns.values():
+            if column.kind == DATETIME:
+                values = np.array(column.values, dtype='datetime64[s]')
+                values[column.get_mask()] = np.datetime64('NaT')
+            elif column.kind == INT and column.has_nulls():
+                values = np.array(column.values, dtype='f8')
+                values[column.get_mask()] = np.nan
+            elif column.kind in _ARRAY_TYPECODES:
+                values = np.array(column.values,
+                                  dtype={INT: 'i8', FLOAT: 'f8', BOOL: '?'}[column.kind])
+            else:
+                values = np.empty(len(column.values), dtype=object)
+                values[:] = column.values
+            dtypes.append((column.name, values.dtype))
+            data.append(values)
+
+        rv = np.empty(len(self), dtype=dtypes)
+        for (name, _), values in zip(dtypes, data):
+            rv[name] = values
+        return rv
+
+    def to_pandas(self):
+        """
+        DataFrame with nullable Int64/boolean columns and utc datetimes.
+        """
+        import numpy as np
+        import pandas as pd
+
+        data = {}
+        for column in self.columns.values():
+            if column.mask is None:
+                data[column.name] = pd.Series(column.values, dtype=object)
+                continue
+            mask, values = column.get_mask(), np.array(column.values)
+            if column.kind == DATETIME:
+                data[column.name] = (pd.Series(pd.to_datetime(values, unit='s', utc=True))
+                                     .mask(mask))
+            elif column.kind == INT:
+                data[column.name] = pd.arrays.IntegerArray(values.astype('i8'), mask)
+            elif column.kind == BOOL:
+                data[column.name] = pd.arrays.BooleanArray(values.astype(bool), mask)
+            else:
+                data[column.name] = pd.arrays.FloatingArray(values.astype('f8'), mask)
+        return pd.DataFrame(data, columns=list(self.columns))
+
+    def to_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        types = {INT: pa.int64(), FLOAT: pa.float64(), BOOL: pa.bool_(),
+                 DATETIME: pa.timestamp('s', tz='UTC')}
+        arrays = []
+        for column in self.columns.values():
+            if column.mask is None:
+                values = [list(v) if isinstance(v, tuple) else v for v in column.values]
+                arrays.append(pa.array(values))
+                continue
+            values = np.array(column.values, dtype={BOOL: bool}.get(column.kind))
+            arrays.append(pa.array(values, mask=column.get_mask(), type=types[column.kind]))
+        return pa.Table.from_arrays(arrays, names=list(self.columns))
@@ -0,0 +1,146 @@
+"""
+Bulk find-or-create of contacts by normalized phone and email values
+(SystemContact.phone and SystemContact.email).
+"""
+import re
+from collections import defaultdict, namedtuple
+
+from .utils import chunked
+
+
+PHONE, EMAIL = 'phone', 'email'
+
+FindOrCreateResult = namedtuple('FindOrCreateResult', 'ids created ambiguous errors')
+
+
+def normalize_phone(value):
+    """
+    Phone digits, with 8 trunk prefix of 11 digits (russian) phones replaced with 7.
+    """
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    return digits or None
+
+
+def normalize_email(value):
+    return (value or '').strip().lower() or None
+
+
+def _values(value):
+    # MultiDict, or enum: value(s) mapping set by user
+    if not value:
+        return ()
+    rv = []
+    for v in value.values():
+        rv.extend(v if isinstance(v, (list, tuple)) else (v,))
+    return rv
+
+
+def get_contact_keys(contact):
+    """
+    Returns set of (PHONE or EMAIL, normalized value) of contact.
+    """
+    keys = {(PHONE, normalize_phone(v)) for v in _values(getattr(contact, 'phone', None))}
+    keys |= {(EMAIL, normalize_email(v)) for v in _values(getattr(contact, 'email', None))}
+    return {key for key in keys if key[1]}
+
+
+class ContactIndex:
+    """
+    Contacts ids by normalized phone and email, built with full scan (ContactIndex.load)
+    and kept actual with update(contacts), modified_since delta for example.
+    """
+
+    def __init__(self):
+        self.ids = defaultdict(set)  # key: contacts ids
+        self._keys = {}  # contact id: keys
+
+    @classmethod
+    def load(cls, client, **iterator_kwargs):
+        rv = cls()
+        rv.update(client.contact.get_iterator(**iterator_kwargs))
+        return rv
+
+    def update(self, contacts):
+        for contact in contacts:
+            self.remove(contact.id)
+            self._keys[contact.id] = keys = get_contact_keys(contact)
+            for key in keys:
+                self.ids[key].add(contact.id)
+        return self
+
+    def remove(self, id):
+        for key in self._keys.pop(id, ()):
+            self.ids[key].discard(id)
+            if not self.ids[key]:
+                del self.ids[key]
+
+    def find(self, keys):
+        return set().union(*(self.ids.get(key, ()) for key in keys))
+
+
+def find_or_create_contacts(client, records, index=None, create=True, chunk_size=100,
+                            workers=4):
+    """
+    Matches records (mapping of key: contact entity with phone and/or email set)
+    with existing contacts by normalized phone and email, creating not matched
+    in batches of chunk_size.
+    Without index existing contacts are searched with one query per unique value
+    (client.search), results are matched by normalized values (not by api fuzzy search).
+    Records sharing value with earlier not matched record are mapped to contact
+    created for it.
+    Returns FindOrCreateResult:
+    ids - key: contact id of matched and created records
+    created - keys of created records
+    ambiguous - key: ids of records matched to more than one contact (not created),
+                empty for records sharing values with different not matched records
+    errors - key: error of records failed to create
+    """
+    records = dict(records)
+    records_keys = {key: get_contact_keys(contact) for key, contact in records.items()}
+
+    if index is None:
+        values = sorted({value for keys in records_keys.values() for _, value in keys})
+        index = ContactIndex().update(
+            obj for objs in client.search('contacts', values, workers).values() for obj in objs
+        )
+
+    ids, ambiguous, errors = {}, {}, {}
+    new, aliases = [], {}  # alias key: key of new record
+    owners = {}  # value key: key of new record
+    for key, keys in records_keys.items():
+        matched = index.find(keys)
+        if not matched:
+            matched_new = {owners[k] for k in keys if k in owners}
+            if len(matched_new) > 1:
+                ambiguous[key] = []
+            elif matched_new:
+                aliases[key] = matched_new.pop()
+            else:
+                new.append(key)
+                owners.update((k, key) for k in keys)
+        elif len(matched) > 1:
+            ambiguous[key] = sorted(matched)
+        else:
+            ids[key] = matched.pop()
+
+    created = set()
+    if create:
+        for chunk in chunked(new, chunk_size):
+            client.post_objects([records[key] for key in chunk])
+            for key in chunk:
+                contact = records[key]
+                if 'error' in contact.meta or contact.id is None:
+                    errors[key] = contact.meta.get('error', 'Not created')
+                else:
+                    ids[key] = contact.id
+                    created.add(key)
+            index.update(records[key] for key in chunk if key in created)
+
+    for key, owner in aliases.items():
+        if owner in ids:
+            ids[key] = ids[owner]
+        elif owner in errors:
+            errors[key] = errors[owner]
+    return FindOrCreateResult(ids, created, ambiguous, errors)
@@ -1,13 +1,17 @@
-from copy import deepcopy
-from collections import UserDict, defaultdict, Mapping
+from array import array
+from copy import copy
+from collections import UserDict, defaultdict, Mapping, MutableMapping
+from threading import RLock
+from weakref import WeakValueDictionary
 
-from marshmallow import fields, pre_load, pre_dump, validate, ValidationError
+from marshmallow import fields, pre_load, pre_dump, ValidationError
 from multidict import MultiDict
 from requests_client.models import Entity
 from requests_client.utils import cached_property
 
 from .constants import FIELD_TYPE
 from .utils import get_one
+from .metadata import EnumIndex
 
 
 class SmartAddress(Entity):
@@ -58,13 +62,126 @@ class _CustomFieldsData(UserDict):
 
     @classmethod
     def create_data_cls(cls, custom_fields):
-        cls = deepcopy(cls)
-        cls._id_name_map = {id: f.custom_field_meta['name']
-                            for id, f in custom_fields.items()}
-        cls._name_ids_map = defaultdict(list)
-        for id, name in cls._id_name_map.items():
-            cls._name_ids_map[name].append(id)
-        return cls
+        # Subclassing, because deepcopy(cls) returns the same class,
+        # and every binding (model, nested schema, rebind) needs its own maps
+        id_name_map = {id: f.custom_field_meta['name'] for id, f in custom_fields.items()}
+        name_ids_map = defaultdict(list)
+        for id, name in id_name_map.items():
+            name_ids_map[name].append(id)
+        rv = type(cls.__name__, (cls,), {'_id_name_map': id_name_map,
+                                         '_name_ids_map': name_ids_map})
+        rv.lazy_cls = type(cls.__name__, (_LazyCustomFieldsData, rv), {})
+        return rv
+
+
+class _LazyCustomFieldsData(_CustomFieldsData):
+    """
+    _CustomFieldsData for lazy entities, keeps raw values and deserializes them
+    on first access. Accessing .data deserializes all values.
+    """
+    def __init__(self, custom_fields, values, attr, item):
+        self._custom_fields, self._attr, self._item = custom_fields, attr, item
+        self._values = values  # id: raw or deserialized value
+        self._raw_ids = set(values)
+
+    def _get(self, id):
+        if id in self._raw_ids:
+            self._values[id] = self._custom_fields[id].deserialize(self._values[id],
+                                                                   self._attr, self._item)
+            self._raw_ids.discard(id)
+        return self._values[id]
+
+    @property
+    def data(self):
+        for id in tuple(self._raw_ids):
+            self._get(id)
+        return self._values
+
+    def __getitem__(self, key):
+        key = self._get_key(key)
+        if key not in self._values:
+            raise KeyError(key)
+        return self._get(key)
+
+    def __setitem__(self, key, item):
+        key = self._get_key(key)
+        self._raw_ids.discard(key)
+        self._values[key] = item
+
+    def __delitem__(self, key):
+        key = self._get_key(key)
+        self._raw_ids.discard(key)
+        del self._values[key]
+
+    def __contains__(self, key):
+        return self._get_key(key) in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class _CompactCustomFieldsData(MutableMapping):
+    """
+    _CustomFieldsData for compact entities, ids are stored in array
+    and values in tuple, instead of per-entity dict.
+    """
+    __slots__ = ('_data_cls', '_ids', '_values')
+
+    def __init__(self, data):
+        self._data_cls = data.__class__
+        self._ids, self._values = array('q', data.data), tuple(data.data.values())
+
+    def _get_key(self, key):
+        return self._data_cls._get_key(self._data_cls, key)
+
+    def _index(self, key):
+        key = self._get_key(key)
+        try:
+            return self._ids.index(key)
+        except ValueError:
+            raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self._values[self._index(key)]
+
+    def __setitem__(self, key, item):
+        try:
+            i = self._index(key)
+        except KeyError:
+            self._ids.append(self._get_key(key))
+            self._values += (item,)
+        else:
+            self._values = self._values[:i] + (item,) + self._values[i + 1:]
+
+    def __delitem__(self, key):
+        i = self._index(key)
+        del self._ids[i]
+        self._values = self._values[:i] + self._values[i + 1:]
+
+    def __contains__(self, key):
+        return self._get_key(key) in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def data(self):
+        return dict(zip(self._ids, self._values))
+
+    def __str__(self):
+        return _CustomFieldsData.__str__(self)
+
+    __repr__ = __str__
+
+    @property
+    def _id_name_map(self):
+        return self._data_cls._id_name_map
 
 
 class _CustomFields(fields.Field):
@@ -72,7 +189,18 @@ class _CustomFields(fields.Field):
     This is composite field for binded and unbinded custom fields.
     Unbinded custom fields created dynamically from client.account_info.custom_fields
     """
-    custom_fields = None
+    # (custom_fields, data_cls) replaced at once on rebind,
+    # so concurrent (de)serialization always sees consistent binding
+    _binding = None
+    bound_fields = ()
+
+    @property
+    def custom_fields(self):
+        return self._binding and self._binding[0]
+
+    @property
+    def data_cls(self):
+        return self._binding and self._binding[1]
 
     def _bind_model_custom_field_property(self, name, field_id):
         prop = property(lambda self: self.custom_fields.get(field_id))
@@ -85,93 +213,175 @@ class _CustomFields(fields.Field):
         setattr(self.parent.entity, name, prop)
         setattr(self.parent.entity, name, prop.setter(setter))
 
-    def _bind_custom_fields(self, custom_fields_meta, schema, pop=True):
-        custom_fields = {}
-
+    def _bind_custom_fields(self, custom_fields_index, schema, pop=True):
         # Binded to model fields
-        for name, field in tuple(self.parent.fields.items()):
-            if isinstance(field, _CustomFieldMixin):
-                id = field._bind_from_custom_fields_meta(custom_fields_meta)
-                assert id not in custom_fields, 'Custom field bind failed: duplicate id %s' % id
-                custom_fields[id] = field
-                if pop:
-                    del schema.fields[name]  # removing from schema
-                self._bind_model_custom_field_property(field.name, id)
+        self.bound_fields = tuple(field for field in self.parent.fields.values()
+                                  if isinstance(field, _CustomFieldMixin))
+        if pop:
+            for field in self.bound_fields:
+                del schema.fields[field.name]  # removing from schema
+        self._set_binding(custom_fields_index, self.bound_fields)
+        _bound[id(self)] = self
+
+    def _rebind_custom_fields(self, custom_fields_index):
+        # Binded fields are copied, so old binding stays untouched while in use
+        self._set_binding(custom_fields_index,
+                          [field._copy_unbinded() for field in self.bound_fields])
+
+    def _set_binding(self, custom_fields_index, bound_fields):
+        custom_fields = {}
+        for field in bound_fields:
+            id = field._bind_from_custom_fields_index(custom_fields_index)
+            assert id not in custom_fields, 'Custom field bind failed: duplicate id %s' % id
+            custom_fields[id] = field
 
         # Unbinded fields
-        for id in (set(custom_fields_meta.keys()) - set(custom_fields.keys())):
-            custom_fields[id] = create_custom_field(custom_fields_meta[id])
-
-        self.custom_fields = custom_fields
-
-    @cached_property
-    def data_cls(self):
-        return _CustomFieldsData.create_data_cls(self.custom_fields)
+        for id in (set(custom_fields_index.by_id) - set(custom_fields)):
+            custom_fields[id] = create_custom_field(custom_fields_index.by_id[id],
+                                                    custom_fields_index.enums.get(id))
+
+        self._binding = (custom_fields, _CustomFieldsData.create_data_cls(custom_fields))
+        for field in bound_fields:
+            self._bind_model_custom_field_property(field.name,
+                                                   field.custom_field_meta['id'])
+
+    def _get_known_values(self, value):
+        custom_fields, data_cls = self._binding
+        client = self.parent.entity.client
+        refresh_min_seconds = client.custom_fields_refresh_min_seconds
+        if refresh_min_seconds is not None and any(v['id'] not in custom_fields for v in value):
+            # Custom field was added after binding
+            client.refresh_custom_fields(max_age_seconds=refresh_min_seconds)
+            custom_fields, data_cls = self._binding
+
+        rv = {}
+        for v in value:
+            if v['id'] not in custom_fields:
+                if not client.skip_unknown_custom_fields:
+                    raise KeyError('Unknown custom field %s of %s' % (
+                        v['id'], self.parent.entity.model_plural_name
+                    ))
+                client.logger.warning('Skipping unknown custom field %s of %s', v['id'],
+                                      self.parent.entity.model_plural_name)
+                continue
+            rv[v['id']] = v['values']
+        return custom_fields, data_cls, rv
 
     def _deserialize(self, value, attr, data):
-        return self.data_cls({
-            v['id']: self.custom_fields[v['id']].deserialize(v['values'], attr, data)
-            for v in value
-        })
+        custom_fields, data_cls, values = self._get_known_values(value)
+        return data_cls({id: custom_fields[id].deserialize(v, attr, data)
+                         for id, v in values.items()})
+
+    def deserialize_lazy(self, value, attr, data):
+        """
+        Returns custom fields data with values deserialized on first access.
+        """
+        if not value:
+            return self.deserialize(value, attr, data)
+        custom_fields, data_cls, values = self._get_known_values(value)
+        return data_cls.lazy_cls(custom_fields, values, attr, data)
 
     def _serialize(self, value, attr, obj):
         if not isinstance(value, Mapping):
             raise ValidationError('custom_fields must be mapping, not %s' % type(value))
 
+        custom_fields, data_cls = self._binding
+        if isinstance(value, _LazyCustomFieldsData):
+            # Not accessed values are passed raw, without deserializing them
+            return [
+                {'id': id, 'values': (value._values[id] if id in value._raw_ids else
+                                      custom_fields[id]._serialize(value._values[id], attr, obj))}
+                for id in value
+            ]
+
         # We should do this because we may have custom fields property binded after
         # some data was set to fields, because of tricky lazy binding
-        for field_id, field in self.custom_fields.items():
-            if field.name and field.name in obj.__dict__:
+        obj_dict = getattr(obj, '__dict__', {})  # compact entities have no __dict__
+        for field_id, field in custom_fields.items():
+            if field.name and field.name in obj_dict:
                 # Field is binded to model, but proxy property was not set yet
-                value[field_id] = obj.__dict__[field.name]
+                value[field_id] = obj_dict[field.name]
 
         return [
-            {'id': id, 'values': self.custom_fields[id]._serialize(v, attr, obj)}
-            for id, v in self.data_cls(value).items()
+            {'id': id, 'values': custom_fields[id]._serialize(v, attr, obj)}
+            for id, v in data_cls(value).items()
         ]
 
 
+_bind_lock = RLock()
+_bound = WeakValueDictionary()  # id(_CustomFields): _CustomFields, for rebinding
+
+
+def rebind_custom_fields(client, model_plural_names):
+    """
+    Rebinds custom fields of already binded schemas (including nested ones)
+    of client models to actual client.account_index.
+    """
+    with _bind_lock:
+        for field in tuple(_bound.values()):
+            entity = field.parent.entity
+            binded = getattr(entity, '_client', None) is client
+            if binded and entity.model_plural_name in model_plural_names:
+                field._rebind_custom_fields(
+                    client.account_index.get_custom_fields(entity.model_plural_name)
+                )
+
+
 class CustomFieldsSchemaMixin:
     custom_fields = _CustomFields(default={})
 
     @pre_dump
     @pre_load
     def _maybe_bind_custom_fields(self, data):
+        client = self.entity.client
+        if client.custom_fields_refresh_seconds:
+            client.refresh_custom_fields(max_age_seconds=client.custom_fields_refresh_seconds)
+
         if self.fields['custom_fields'].custom_fields is None:
-            custom_fields_meta ={
-                m.id: m for m in
-                (self.entity.client.account_info['custom_fields']
-                 [self.entity.model_plural_name] or {}).values()
-            }
-            self.fields['custom_fields']._bind_custom_fields(custom_fields_meta, self, pop=True)
+            with _bind_lock:
+                # Schema may be used in multiple threads, so binding only once
+                if self.fields['custom_fields'].custom_fields is None:
+                    custom_fields_index = (client.account_index
+                                           .get_custom_fields(self.entity.model_plural_name))
+                    self.fields['custom_fields']._bind_custom_fields(custom_fields_index, self,
+                                                                     pop=True)
         return data
 
 
 class _CustomFieldMixin:
     field_type = None
 
-    def __init__(self, *args, custom_field_meta=None, **kwargs):
+    def __init__(self, *args, custom_field_meta=None, enum_index=None, **kwargs):
         self.custom_field_meta = custom_field_meta
+        self.enum_index = enum_index
         super().__init__(*args, **kwargs)
 
-    def _get_from_custom_fields_meta(self, data):
+    def _get_from_custom_fields_index(self, index):
         for attr in ('id', 'code', 'name'):
             if self.metadata.get(attr):
                 try:
-                    return get_one(data.values(), lambda m: m[attr] == self.metadata[attr])
+                    return get_one(index.find(attr, self.metadata[attr]))
                 except IndexError as exc:
                     raise RuntimeError('Custom field bind by %s "%s" failed: %s' %
                                        (attr, self.metadata[attr], str(exc)))
         raise RuntimeError('Custom field must be binded by "id", "code" or "name"')
 
-    def _bind_from_custom_fields_meta(self, data):
-        meta = self._get_from_custom_fields_meta(data)
+    def _bind_from_custom_fields_index(self, index):
+        meta = self._get_from_custom_fields_index(index)
         if self.field_type != FIELD_TYPE(meta['field_type']):
             raise RuntimeError('Custom field bind %s %s failed: expected type %s got %s instead',
                                meta['id'], meta['name'], self.field_type, meta['field_type'])
         self.custom_field_meta = meta
+        self.enum_index = index.enums.get(meta['id'])
         return meta['id']
 
+    def _copy_unbinded(self):
+        rv = copy(self)
+        rv.custom_field_meta = rv.enum_index = None
+        # Dropping cached enums built from previous metadata
+        rv.__dict__.pop('enums', None)
+        return rv
+
     def __repr__(self):
         return ('<fields.{ClassName}(custom_field_meta={self.custom_field_meta})>'
                 .format(ClassName=self.__class__.__name__, self=self))
@@ -188,20 +398,29 @@ class _SingleMixin:
 
 
 class _EnumsMixin:
+    def _get_enum_index(self):
+        if self.enum_index is None:
+            self.enum_index = EnumIndex(self.custom_field_meta['enums'])
+        return self.enum_index
+
     @cached_property
     def enums(self):
-        rv = set(self.custom_field_meta['enums'].values())
-        if len(rv) != len(self.custom_field_meta['enums']):
-            # TODO: Actually we can have enums with duplicated names,
-            # consider it as wrapper restriction.
-            # Maybe this should be raised only on enum with duplicated name usage?
-            # Merge requests are welcome, maybe something like in CustomFieldsData
+        rv = self._get_enum_index().values
+        if not self.enum_index.is_unique:
+            # NOTE: (de)serialization uses index and fails only on usage
+            # of enum with duplicated name
             raise RuntimeError('Enums are not unique: %s' % self)
         return rv
 
-    @cached_property
-    def enum_validator(self):
-        return validate.OneOf(self.enums)
+    def get_enum_id(self, value):
+        """
+        Returns enum id of value, raises ValidationError on unknown or duplicated value.
+        """
+        index = self._get_enum_index()
+        try:
+            return index.get_id(value)
+        except ValueError as exc:
+            raise ValidationError('%s, expected one of %s' % (exc, sorted(index.values)))
 
 
 class TextField(_SingleMixin, _CustomFieldMixin, fields.String):
@@ -220,8 +439,7 @@ class SelectField(_EnumsMixin, TextField):
     field_type = FIELD_TYPE.SELECT
 
     def _validate(self, value):
-        if not self.validators:
-            self.validators.append(self.enum_validator)
+        self.get_enum_id(value)
         return super()._validate(value)
 
     def _serialize(self, value, attr, obj):
@@ -235,17 +453,15 @@ class MultiSelectField(_SingleMixin, _EnumsMixin, _CustomFieldMixin, fields.Raw)
     def _deserialize(self, value, attr, data):
         values = [v['value'] for v in (value or [])]
         for v in values:
-            self.enum_validator(v)
+            self.get_enum_id(v)
         return values
 
     def _serialize(self, value, attr, obj):
         if value is not None:
             if not isinstance(value, (list, set, tuple)):
-                raise ValidationError('Expected enum list %s, got %s' %
-                                      (self.enums, type(value)))
-            if set(value) - self.enums:
-                raise ValidationError('Unexpected enums %s not in %s' %
-                                      (set(value) - self.enums, self.enums))
+                raise ValidationError('Expected enum list, got %s' % type(value))
+            for v in value:
+                self.get_enum_id(v)
             return [{'value': v} for v in value]
 
 
@@ -261,19 +477,15 @@ class MultiTextField(_SingleMixin, _EnumsMixin, _CustomFieldMixin, fields.Raw):
     field_type = FIELD_TYPE.MULTITEXT
 
     def _deserialize(self, value, attr, data):
-        return MultiDict(
-            (self.custom_field_meta['enums'][v['enum']], v['value'])
-            for v in value
-        )
+        index = self._get_enum_index()
+        return MultiDict((index.get_value(v['enum']), v['value']) for v in value)
 
     def _serialize(self, value, attr, obj):
         if value is not None:
             if not isinstance(value, Mapping):
-                raise ValidationError('Expected enum mapping %s, got %s' %
-                                      (self.enums, type(value)))
-            if set(value.keys()) - self.enums:
-                raise ValidationError('Unexpected enums %s not in %s' %
-                                      (set(value.keys()) - self.enums, self.enums))
+                raise ValidationError('Expected enum mapping, got %s' % type(value))
+            for k in set(value.keys()):
+                self.get_enum_id(k)
             return [{'enum': k, 'value': v} for k, v in value.items()]
 
 
@@ -339,8 +551,9 @@ CUSTOM_FIELD_MAP = {
 }
 
 
-def create_custom_field(meta):
+def create_custom_field(meta, enum_index=None):
     """
     Factory for dynamically creating custom field from metadata based on field_type.
     """
-    return CUSTOM_FIELD_MAP[FIELD_TYPE(meta['field_type'])](custom_field_meta=meta)
+    return CUSTOM_FIELD_MAP[FIELD_TYPE(meta['field_type'])](custom_field_meta=meta,
+                                                            enum_index=enum_index)
@@ -0,0 +1,197 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from requests_client.utils import utcnow
+
+
+# Model name: EntityField relations
+RELATIONS = {
+    'lead': ('contacts', 'company', 'main_contact'),
+    'contact': ('leads', 'company'),
+    'company': ('contacts',),
+}
+
+
+def _get_ids(entity, relation):
+    value = getattr(entity, relation, None)
+    if not value:  # None, missing or empty list
+        return ()
+    if not isinstance(value, (list, tuple)):
+        value = (value,)
+    return [obj.id for obj in value if obj is not None and obj.id is not None]
+
+
+class _AdjacencyBuilder:
+    def __init__(self):
+        self.sources, self.starts, self.targets = array('q'), array('q'), array('q')
+
+    def add(self, source, ids):
+        self.sources.append(source)
+        self.starts.append(len(self.targets))
+        self.targets.extend(ids)
+
+    def build(self):
+        self.starts.append(len(self.targets))
+        # Last added adjacency of source wins
+        last = {source: i for i, source in enumerate(self.sources)}
+        rv = _Adjacency()
+        for source in sorted(last):
+            i = last[source]
+            rv.keys.append(source)
+            rv.targets.extend(self.targets[self.starts[i]:self.starts[i + 1]])
+            rv.offsets.append(len(rv.targets))
+        return rv
+
+
+class _Adjacency:
+    """
+    Source id -> target ids in CSR arrays (sorted source ids, offsets, targets),
+    updated sources are stored in overlay until compact().
+    """
+    def __init__(self):
+        self.keys, self.offsets, self.targets = array('q'), array('q', [0]), array('q')
+        self.overlay = {}  # source id: target ids array, replaces base adjacency
+
+    def _find(self, source):
+        i = bisect_left(self.keys, source)
+        if i < len(self.keys) and self.keys[i] == source:
+            return i
+
+    def get(self, source):
+        if source in self.overlay:
+            return self.overlay[source]
+        i = self._find(source)
+        if i is None:
+            return array('q')
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def set(self, source, ids):
+        self.overlay[source] = array('q', ids)
+
+    def items(self):
+        for i, source in enumerate(self.keys):
+            if source not in self.overlay:
+                yield source, self.targets[self.offsets[i]:self.offsets[i + 1]]
+        for source, ids in self.overlay.items():
+            if ids:
+                yield source, ids
+
+    def compact(self):
+        builder = _AdjacencyBuilder()
+        for source, ids in self.items():
+            builder.add(source, ids)
+        return builder.build()
+
+    def reversed(self):
+        reversed_ = defaultdict(lambda: array('q'))
+        for source, ids in self.items():
+            for id in ids:
+                reversed_[id].append(source)
+        builder = _AdjacencyBuilder()
+        for source, ids in reversed_.items():
+            builder.add(source, ids)
+        return builder.build()
+
+    @property
+    def edges_count(self):
+        rv = len(self.targets) + sum(len(ids) for ids in self.overlay.values())
+        for source in self.overlay:
+            i = self._find(source)
+            if i is not None:
+                rv -= self.offsets[i + 1] - self.offsets[i]
+        return rv
+
+
+class RelationGraph:
+    """
+    In-memory graph of entities relations (EntityField links, see RELATIONS),
+    stored as id arrays per (model_name, relation), not as entities.
+    Updated entities are kept in overlay and merged into arrays
+    when overlay exceeds compact_ratio of entities.
+    NOTE: deleted entities are not returned by modified_since deltas,
+    so they're removed only with remove() or on full reload.
+    """
+
+    def __init__(self, relations=RELATIONS, compact_ratio=0.1):
+        self.relations = {model_name: tuple(relations_)
+                          for model_name, relations_ in relations.items()}
+        self.compact_ratio = compact_ratio
+        self._adjacency = {(model_name, relation): _Adjacency()
+                           for model_name, relations_ in self.relations.items()
+                           for relation in relations_}
+        self._reversed = {}  # (model_name, relation): _Adjacency, built on demand
+        self.loaded_at = None
+
+    @classmethod
+    def load(cls, client, relations=RELATIONS, compact_ratio=0.1, **iterator_kwargs):
+        """
+        Builds graph iterating all entities of relations models,
+        iterator_kwargs are passed to model get_iterator (cursor_count, process_pool, etc).
+        """
+        graph = cls(relations, compact_ratio)
+        graph.loaded_at = utcnow()
+        for model_name, relations_ in graph.relations.items():
+            builders = {relation: _AdjacencyBuilder() for relation in relations_}
+            for entity in client.models[model_name].get_iterator(**iterator_kwargs):
+                for relation, builder in builders.items():
+                    builder.add(entity.id, _get_ids(entity, relation))
+            for relation, builder in builders.items():
+                graph._adjacency[(model_name, relation)] = builder.build()
+        return graph
+
+    def update_from_client(self, client, modified_since=None, **iterator_kwargs):
+        """
+        Updates graph with entities modified since last load or update.
+        Returns updated entities count.
+        """
+        modified_since = modified_since or self.loaded_at
+        if not modified_since:
+            raise ValueError('modified_since required for not loaded graph')
+        started_at, count = utcnow(), 0
+        for model_name in self.relations:
+            iterator = client.models[model_name].get_iterator(modified_since=modified_since,
+                                                              **iterator_kwargs)
+            count += self.update(iterator)
+        self.loaded_at = started_at
+        return count
+
+    def update(self, entities):
+        count = 0
+        for entity in entities:
+            for relation in self.relations[entity.model_name]:
+                self._adjacency[(entity.model_name, relation)].set(
+                    entity.id, _get_ids(entity, relation)
+                )
+            count += 1
+        self._changed()
+        return count
+
+    def remove(self, model_name, ids):
+        for relation in self.relations[model_name]:
+            for id in ids:
+                self._adjacency[(model_name, relation)].set(id, ())
+        self._changed()
+
+    def _changed(self):
+        self._reversed.clear()
+        for key, adjacency in self._adjacency.items():
+            if len(adjacency.overlay) > self.compact_ratio * len(adjacency.keys):
+                self._adjacency[key] = adjacency.compact()
+
+    def neighbors(self, model_name, id, relation, reverse=False):
+        """
+        Returns ids array of entities linked by model_name relation,
+        with reverse=True - ids of model_name entities linking to id by relation,
+        for example neighbors('lead', contact_id, 'contacts', reverse=True) is contact leads.
+        """
+        key = (model_name, relation)
+        if not reverse:
+            return self._adjacency[key].get(id)
+        if key not in self._reversed:
+            self._reversed[key] = self._adjacency[key].reversed()
+        return self._reversed[key].get(id)
+
+    @property
+    def edges_count(self):
+        return sum(adjacency.edges_count for adjacency in self._adjacency.values())
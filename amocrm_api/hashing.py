@@ -0,0 +1,75 @@
+"""
+Content hashes of entities for outbound sync: entity is posted only if
+hash of its dumped payload changed since last successful write (see client.upsert_objects).
+"""
+import json
+import sqlite3
+from hashlib import sha1
+from threading import Lock
+
+
+# Not content, changed on every write
+HASH_EXCLUDE = ('id', 'updated_at')
+
+
+def _normalize(data, exclude=()):
+    if isinstance(data, dict):
+        return {k: _normalize(v) for k, v in data.items() if k not in exclude}
+    if isinstance(data, (list, tuple)):
+        return [_normalize(v) for v in data]
+    return data
+
+
+def content_hash(obj, exclude=HASH_EXCLUDE):
+    """
+    Stable hash of entity dump (with custom fields sorted by id), excluding exclude keys.
+    """
+    data = _normalize(obj.dump(), exclude)
+    if data.get('custom_fields'):
+        data['custom_fields'] = sorted(data['custom_fields'], key=lambda v: v['id'])
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+                         default=str)
+    return sha1(payload.encode()).hexdigest()
+
+
+class HashStore:
+    """
+    Last written content hash and entity id by model and record key
+    (id of record in source database for example), in SQLite database.
+    """
+
+    def __init__(self, path=':memory:'):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS hashes (model TEXT, key TEXT, '
+                               'hash TEXT, id INTEGER, PRIMARY KEY (model, key))')
+
+    def get_many(self, model, keys):
+        """
+        Returns {key: (hash, id)} of stored keys.
+        """
+        rv, keys = {}, [str(key) for key in keys]
+        with self._lock:
+            for i in range(0, len(keys), 500):  # sqlite variables limit
+                chunk = keys[i:i + 500]
+                rv.update(
+                    (key, (hash, id)) for key, hash, id in self._conn.execute(
+                        'SELECT key, hash, id FROM hashes WHERE model = ? AND key IN (%s)' %
+                        ','.join('?' * len(chunk)), [model] + chunk
+                    )
+                )
+        return rv
+
+    def set_many(self, model, items):
+        """
+        Stores items of (key, hash, id).
+        """
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
+                                   ((model, str(key), hash, id) for key, hash, id in items))
+
+    def delete_many(self, model, keys):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM hashes WHERE model = ? AND key = ?',
+                                   ((model, str(key)) for key in keys))
@@ -0,0 +1,268 @@
+from datetime import timezone
+from inspect import signature
+from time import monotonic
+
+from requests_client.cursor_fetch import CursorFetchIterator
+from requests_client.utils import utcnow
+
+from .utils import dump_token, load_token
+from .retry import RetryPolicy
+
+
+MAX_CURSOR_COUNT = 500  # api maximum of limit_rows
+
+
+class AdaptivePageSize:
+    """
+    Page size (limit_rows) controller, aiming to target_seconds per page
+    (including response parsing), and max_bytes per response if set.
+    On errors retryable by retry_policy (timeout, connection error or 5xx,
+    except 429 rate limit) page size is decreased by half, and same page is requested again.
+    """
+    def __init__(self, target_seconds=2, min_count=10, max_count=MAX_CURSOR_COUNT,
+                 max_bytes=None, smoothing=0.5, max_growth=2, retry_policy=None):
+        self.target_seconds = target_seconds
+        self.min_count, self.max_count = min_count, min(max_count, MAX_CURSOR_COUNT)
+        self.max_bytes = max_bytes
+        self.smoothing = smoothing
+        self.max_growth = max_growth
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def _clamp(self, count):
+        return int(max(self.min_count, min(self.max_count, count)))
+
+    def update(self, count, fetched_count, elapsed_seconds, size):
+        if not fetched_count:
+            return count
+        # For last page fetched_count is less than count, so estimating per entity
+        ideal = self.target_seconds / (elapsed_seconds / fetched_count or 1e-3)
+        if self.max_bytes and size:
+            ideal = min(ideal, self.max_bytes / (size / fetched_count))
+        ideal = min(ideal, count * self.max_growth)
+        return self._clamp(count * self.smoothing + ideal * (1 - self.smoothing))
+
+    def failed(self, count):
+        return self._clamp(count // 2)
+
+    def is_retryable(self, exc):
+        # Smaller page doesn't help with rate limit
+        return self.retry_policy.is_retryable(exc) and getattr(exc, 'status', None) != 429
+
+
+class ObjectsFetchIterator(CursorFetchIterator):
+    """
+    Iterator over client.get_<model_plural_name> results, using limit_offset as cursor.
+    State (model, filters, limit_offset and cursor_count) may be saved as token
+    on demand or periodically with checkpoint callback, and iteration may be resumed
+    later with client.get_iterator_from_token(token).
+
+    With consistent=True iterator remembers yielded ids and checks page boundaries
+    by fetching every page with one entity overlap, so entities added or removed
+    while iteration is in progress are not yielded twice or skipped.
+    Entities added before cursor are caught by modified_since delta pass
+    after the scan (if delta_pass and model supports modified_since).
+    Token keeps only yielded ids of current page, so after resume entities
+    modified while scan was in progress may be yielded again by delta pass.
+
+    With page_size=True (or AdaptivePageSize instance) cursor_count is changed
+    for every page based on response time, size and errors.
+    """
+
+    def __init__(self, client, model, filters={}, cursor=None, cursor_count=500,
+                 checkpoint=None, checkpoint_every=1,
+                 consistent=False, delta_pass=True, max_backtrack=10,
+                 seen=(), page_ids=(), started_at=None, page_size=None, **kwargs):
+        self.client = client
+        self.model = model
+        self.filters = filters
+        self.cursor_count = cursor_count
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.page_size = (AdaptivePageSize() if page_size is True else page_size)
+
+        self.consistent = consistent
+        self.delta_pass = delta_pass
+        self.max_backtrack = max_backtrack
+        self.seen = set(seen)
+        self.page_ids = list(page_ids)  # ids of page ending at cursor, for boundaries check
+        self.started_at = started_at
+        self.drift_count = 0
+        self._page_seen = list(seen)  # yielded ids of last fetched page, for token
+        self._last_fetch = None  # (cursor, page_ids) before last fetch
+        self._delta_iterator = None
+
+        super().__init__(cursor=cursor or 0, **kwargs)
+
+    @property
+    def offset(self):
+        # Offset of first entity not yielded yet (fetched, but not consumed
+        # entities should be fetched again after resume)
+        return self.cursor - len(self._iterable)
+
+    @property
+    def state(self):
+        if not self.consistent:
+            return {
+                'model': self.model,
+                'filters': self.filters,
+                'limit_offset': self.offset,
+                'cursor_count': self.cursor_count,
+            }
+
+        # Not consumed entities are filtered out by seen ids after refetch
+        iterator = self._delta_iterator or self
+        cursor, page_ids = ((iterator.cursor, iterator.page_ids) if not self._iterable
+                            else self._last_fetch)
+        return {
+            'model': self.model,
+            'filters': iterator.filters,
+            'limit_offset': cursor,
+            'cursor_count': self.cursor_count,
+            'consistent': True,
+            'delta_pass': self.delta_pass and not self._delta_iterator,
+            'seen': self._page_seen,
+            'page_ids': page_ids,
+            'started_at': self.started_at,
+        }
+
+    @property
+    def token(self):
+        return dump_token(self.state)
+
+    @classmethod
+    def from_token(cls, client, token, **kwargs):
+        state = load_token(token) if isinstance(token, str) else token
+        kwargs.update({k: state[k] for k in
+                       ('consistent', 'delta_pass', 'seen', 'page_ids', 'started_at')
+                       if k in state})
+        return cls(client, state['model'], state['filters'], cursor=state['limit_offset'],
+                   cursor_count=state['cursor_count'], **kwargs)
+
+    def get_page(self, cursor, overlap=0, count=None):
+        """
+        Returns entities list and requested count (page size may be changed
+        on error by page_size controller)
+        """
+        method = getattr(self.client, 'get_%s' % self.model)
+        while True:
+            # Overlap is included in api maximum
+            cursor_count = min(count or self.cursor_count, MAX_CURSOR_COUNT - overlap) + overlap
+            started_at = monotonic()
+            try:
+                resp = method(**self.filters, cursor=cursor, cursor_count=cursor_count)
+            except Exception as exc:
+                if not self.page_size or count or not self.page_size.is_retryable(exc):
+                    raise
+                page_count = self.page_size.failed(self.cursor_count)
+                if page_count >= self.cursor_count:
+                    raise
+                self.client.logger.warning('%s page size %s -> %s on error: %r', self.model,
+                                           self.cursor_count, page_count, exc)
+                self.cursor_count = page_count
+                continue
+
+            if self.page_size and not count:
+                self.cursor_count = self.page_size.update(
+                    self.cursor_count, len(resp.data), monotonic() - started_at,
+                    len(resp.content or b'')
+                )
+            return resp.data, cursor_count
+
+    def _next(self):
+        obj = super()._next()
+        if self.consistent:
+            self.seen.add(obj.id)
+            self._page_seen.append(obj.id)
+        return obj
+
+    def _maybe_checkpoint(self):
+        # Called on fetch, all previously fetched entities are consumed at this point
+        if self.checkpoint and self.fetch_count > 1 and not (
+                (self.fetch_count - 1) % self.checkpoint_every):
+            self.checkpoint(self.token)
+
+    def _fetch(self):
+        self._maybe_checkpoint()
+        if self.consistent:
+            return self._fetch_consistent()
+
+        data, cursor_count = self.get_page(self.cursor)
+        self.has_more = (len(data) >= cursor_count)
+        self.cursor += len(data)
+        return data
+
+    def _fetch_consistent(self):
+        if not self.started_at:
+            self.started_at = utcnow().replace(microsecond=0)
+
+        while True:
+            if self._delta_iterator:
+                self._last_fetch = (self._delta_iterator.cursor, [])
+                data = self._delta_iterator._fetch()
+                self.has_more = self._delta_iterator.has_more
+            else:
+                data = self._fetch_checked()
+                if not self.has_more:
+                    self._maybe_start_delta_pass()
+
+            self._page_seen = [obj.id for obj in data if obj.id in self.seen]
+            data = [obj for obj in data if obj.id not in self.seen]
+            if data or not self.has_more:
+                return data
+
+    def _fetch_checked(self):
+        self._last_fetch = (self.cursor, self.page_ids)
+        if not self.page_ids:
+            data, cursor_count = self.get_page(self.cursor)
+            self.has_more = (len(data) >= cursor_count)
+            self.cursor += len(data)
+            self.page_ids = [obj.id for obj in data]
+            return data
+
+        # Fetching with last entity of previous page to check that boundaries not shifted
+        prev_ids, offset = set(self.page_ids), self.cursor - 1
+        data, cursor_count = self.get_page(offset, overlap=1)
+        self.has_more = (len(data) >= cursor_count)
+        self.cursor = offset + len(data)
+        self.page_ids = [obj.id for obj in data]
+
+        windows, backtrack = data, 0
+        while offset > 0 and backtrack < self.max_backtrack and not any(
+                obj.id in prev_ids for obj in windows):
+            # Entities were removed before cursor, so some entities moved
+            # to already fetched pages, fetching previous windows
+            backtrack += 1
+            count = min(self.cursor_count, offset)
+            offset -= count
+            windows = self.get_page(offset, count=count)[0] + windows
+
+        idx = max((i for i, obj in enumerate(windows) if obj.id in prev_ids), default=None)
+        if idx != len(windows) - len(data):
+            self.drift_count += 1
+            self.client.logger.info('%s page boundaries shifted at offset %s',
+                                    self.model, self._last_fetch[0])
+        if idx is None:
+            # Should not happen unless all previous page entities were removed
+            self.client.logger.warning('%s page boundaries check failed at offset %s',
+                                       self.model, self._last_fetch[0])
+            return windows
+        return windows[idx + 1:]
+
+    def _maybe_start_delta_pass(self):
+        if not self.delta_pass:
+            return
+        method = getattr(self.client, 'get_%s' % self.model)
+        if 'modified_since' not in signature(method).parameters:
+            self.client.logger.warning('%s not supports modified_since, delta pass skipped',
+                                       self.model)
+            return
+
+        modified_since = self.filters.get('modified_since')
+        if modified_since and not modified_since.tzinfo:
+            modified_since = modified_since.replace(tzinfo=timezone.utc)
+        modified_since = max(modified_since or self.started_at, self.started_at)
+        self._delta_iterator = self.__class__(
+            self.client, self.model, {**self.filters, 'modified_since': modified_since},
+            cursor_count=self.cursor_count,
+        )
+        self.has_more = True
@@ -0,0 +1,288 @@
+"""
+Lease based work queue for export and sync jobs running on many nodes.
+Job is split into units (iterator states of model offset windows or filter partitions),
+units are claimed by workers with lease, which is extended on every iterator checkpoint
+(saving unit iterator token), so unit of dead worker is claimed by other worker
+after lease expiration and resumed from last checkpoint
+(so entities are handled at least once, entities handled after checkpoint are handled again).
+Queue is stored in SQLite database (file on shared storage, local stand-in for real queue),
+lease times are wall clock, so nodes clocks should be synchronized.
+"""
+import sqlite3
+import socket
+import os
+from collections import namedtuple
+from threading import Thread, local
+from time import time, sleep
+
+from .utils import dump_token, load_token
+
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    job TEXT NOT NULL,
+    auth_ident TEXT NOT NULL,
+    token TEXT NOT NULL,
+    stop_offset INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS units_status ON units (status, auth_ident);
+'''
+
+WorkUnit = namedtuple('WorkUnit', 'id job auth_ident state stop_offset attempts count')
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def offset_units(model, window=10000, windows=10, cursor_count=500, **filters):
+    """
+    Splits model scan into offset windows (state, stop_offset),
+    last window is not limited.
+    NOTE: entities added or removed while scan is in progress shift windows,
+    use partition_units for consistent results.
+    """
+    for i in range(windows):
+        state = {'model': model, 'filters': filters, 'limit_offset': i * window,
+                 'cursor_count': min(cursor_count, window)}
+        yield state, ((i + 1) * window if i < windows - 1 else None)
+
+
+def partition_units(model, partition_by, partitions, cursor_count=500, consistent=False,
+                    **filters):
+    """
+    Splits model scan into disjoint partitions by filter key
+    (see client.get_partitioned_iterator), for example "status_id" of leads.
+    """
+    for value in partitions:
+        state = {'model': model, 'filters': dict(filters, **{partition_by: value}),
+                 'limit_offset': 0, 'cursor_count': cursor_count}
+        if consistent:
+            state['consistent'] = True
+        yield state, None
+
+
+class JobQueue:
+    """
+    Units of jobs in SQLite database, path may be shared between nodes.
+    At most max_account_units units are running (with not expired lease)
+    for one account (auth_ident) on all nodes, accounts with less running units
+    are claimed first.
+    """
+
+    def __init__(self, path, lease_seconds=60, max_account_units=2, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_account_units = max_account_units
+        self.max_attempts = max_attempts
+        self._local = local()  # sqlite connection can't be shared between threads
+        self._conn.executescript(_SCHEMA)
+
+    @property
+    def _conn(self):
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return self._local.conn
+
+    def _connection(self):
+        return _Transaction(self._conn)
+
+    def add_job(self, job, auth_ident, units):
+        """
+        Adds units (iterator states or tokens, with stop_offset)
+        from offset_units or partition_units. Returns units ids.
+        """
+        with self._connection() as conn:
+            return [
+                conn.execute('INSERT INTO units (job, auth_ident, token, stop_offset) '
+                             'VALUES (?, ?, ?, ?)',
+                             (job, auth_ident,
+                              state if isinstance(state, str) else dump_token(state),
+                              stop_offset)).lastrowid
+                for state, stop_offset in units
+            ]
+
+    def claim(self, worker):
+        """
+        Leases next pending (or expired) unit to worker, returns WorkUnit or None.
+        """
+        now = time()
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT u.id, (SELECT count(*) FROM units r WHERE r.auth_ident = u.auth_ident '
+                '  AND r.status = ? AND r.lease_until >= ?) AS running '
+                'FROM units u WHERE (u.status = ? OR (u.status = ? AND u.lease_until < ?)) '
+                'AND running < ? ORDER BY running, u.id LIMIT 1',
+                (RUNNING, now, PENDING, RUNNING, now, self.max_account_units)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute('UPDATE units SET status = ?, worker = ?, lease_until = ?, '
+                         'attempts = attempts + 1 WHERE id = ?',
+                         (RUNNING, worker, now + self.lease_seconds, row[0]))
+            return self._get_unit(conn, row[0])
+
+    def _get_unit(self, conn, id):
+        row = conn.execute('SELECT id, job, auth_ident, token, stop_offset, attempts, count '
+                           'FROM units WHERE id = ?', (id,)).fetchone()
+        return WorkUnit(*row[:3], load_token(row[3]), *row[4:])
+
+    def _update_leased(self, conn, unit, worker, sql, args):
+        cursor = conn.execute(sql + ' WHERE id = ? AND worker = ? AND status = ?',
+                              args + (unit.id, worker, RUNNING))
+        if not cursor.rowcount:
+            raise LeaseLost('Unit %s lease lost by %s' % (unit.id, worker))
+
+    def heartbeat(self, unit, worker, token=None, count=None):
+        """
+        Extends unit lease and saves iterator token, raises LeaseLost
+        if unit was claimed by other worker after lease expiration.
+        """
+        with self._connection() as conn:
+            sql, args = 'UPDATE units SET lease_until = ?', (time() + self.lease_seconds,)
+            if token is not None:
+                sql, args = sql + ', token = ?', args + (token,)
+            if count is not None:
+                sql, args = sql + ', count = ?', args + (count,)
+            self._update_leased(conn, unit, worker, sql, args)
+
+    def complete(self, unit, worker, count=None):
+        with self._connection() as conn:
+            self._update_leased(conn, unit, worker,
+                                'UPDATE units SET status = ?, lease_until = NULL, count = ?',
+                                (DONE, count if count is not None else unit.count))
+
+    def fail(self, unit, worker, error):
+        """
+        Releases unit to be claimed again (resuming from last checkpoint),
+        or marks it failed after max_attempts.
+        """
+        status = FAILED if unit.attempts >= self.max_attempts else PENDING
+        with self._connection() as conn:
+            self._update_leased(conn, unit, worker,
+                                'UPDATE units SET status = ?, lease_until = NULL, error = ?',
+                                (status, repr(error)))
+
+    def release(self, unit, worker):
+        # Returning unit to queue without counting attempt
+        with self._connection() as conn:
+            self._update_leased(conn, unit, worker, 'UPDATE units SET status = ?, '
+                                'lease_until = NULL, attempts = attempts - 1', (PENDING,))
+
+    def retry_failed(self, job=None):
+        sql, args = 'UPDATE units SET status = ?, attempts = 0 WHERE status = ?', (PENDING, FAILED)
+        if job:
+            sql, args = sql + ' AND job = ?', args + (job,)
+        with self._connection() as conn:
+            return conn.execute(sql, args).rowcount
+
+    def get_stats(self, job=None):
+        """
+        Returns units count by status.
+        """
+        sql, args = 'SELECT status, count(*) FROM units', ()
+        if job:
+            sql, args = sql + ' WHERE job = ?', (job,)
+        return dict(self._conn.execute(sql + ' GROUP BY status', args).fetchall())
+
+    def is_finished(self, job=None):
+        stats = self.get_stats(job)
+        return not (stats.get(PENDING) or stats.get(RUNNING))
+
+
+class _Transaction:
+    # Immediate transaction, so concurrent claims from other nodes are serialized
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class JobRunner:
+    """
+    Claims units from queue and runs them in worker threads,
+    calling handler(client, unit, obj) for every entity of unit iterator.
+    Lease is extended and iterator token saved on every page fetch
+    (all previously fetched entities are handled at this point),
+    so lease_seconds should be more than page handling time.
+    Clients are created with client_factory(auth_ident),
+    AmocrmClientManager.get_client for example, to share clients and ratelimits.
+    """
+
+    def __init__(self, queue, client_factory, handler, workers=2, worker_id=None,
+                 poll_seconds=1):
+        self.queue = queue
+        self.client_factory = client_factory
+        self.handler = handler
+        self.workers = workers
+        self.worker_id = worker_id or '%s:%s' % (socket.gethostname(), os.getpid())
+        self.poll_seconds = poll_seconds
+        self._stopped = False
+
+    def run_unit(self, unit, worker):
+        client = self.client_factory(unit.auth_ident)
+        count = unit.count
+
+        def checkpoint(token):
+            self.queue.heartbeat(unit, worker, token, count)
+
+        iterator = client.get_iterator_from_token(unit.state, checkpoint=checkpoint)
+        for obj in iterator:
+            if unit.stop_offset is not None and iterator.offset > unit.stop_offset:
+                break
+            self.handler(client, unit, obj)
+            count += 1
+            if self._stopped:
+                # Unit is resumed from last checkpoint by any worker
+                return self.queue.release(unit, worker)
+        self.queue.complete(unit, worker, count)
+
+    def _work(self, worker, wait):
+        while not self._stopped:
+            unit = self.queue.claim(worker)
+            if not unit:
+                if not wait and self.queue.is_finished():
+                    return
+                # Units are leased by other workers or limited by max_account_units
+                sleep(self.poll_seconds)
+                continue
+            try:
+                try:
+                    self.run_unit(unit, worker)
+                except LeaseLost:
+                    raise
+                except Exception as exc:
+                    self.queue.fail(unit, worker, exc)
+            except LeaseLost:
+                # Lease expired and unit was claimed by other worker
+                pass
+
+    def run(self, wait=False):
+        """
+        Runs workers until all units are done or failed (or forever with wait=True,
+        picking up units added later), until stop() is called.
+        """
+        threads = [Thread(target=self._work, args=('%s:%s' % (self.worker_id, i), wait))
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        # Running units are released after handling current entity
+        self._stopped = True
@@ -0,0 +1,136 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+
+INTERACTIVE, BULK = 0, 1
+
+
+class _Account:
+    def __init__(self, client):
+        self.client = client
+        self.queues = (deque(), deque())  # by priority
+        self.running = 0
+
+    @property
+    def is_idle(self):
+        return not (self.running or any(self.queues))
+
+
+class AmocrmClientManager:
+    """
+    Owns clients for many accounts (keyed by auth_ident) and runs their calls
+    in shared worker pool.
+    Accounts are scheduled round-robin with at most max_account_workers calls
+    running for one account, so one account export can't take all workers,
+    and INTERACTIVE calls always go before BULK calls.
+    Clients are created on first usage with client_factory(auth_ident)
+    ("login:subdomain" ident from storage for example),
+    and least recently used idle clients are evicted over max_clients.
+    Each client has its own ratelimit (concurrent_ratelimit of client
+    if it's not set by factory), so requests are limited per account.
+    """
+
+    def __init__(self, client_factory, workers=16, max_clients=100,
+                 max_account_workers=2):
+        self.client_factory = client_factory
+        self.max_clients = max_clients
+        self.max_account_workers = max_account_workers
+
+        self._accounts = OrderedDict()  # least recently used first
+        self._order = deque()  # round-robin order of auth_idents
+        self._cond = Condition()
+        self._closed = False
+        self._workers = [Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def get_client(self, auth_ident):
+        with self._cond:
+            if auth_ident in self._accounts:
+                self._accounts.move_to_end(auth_ident)
+                return self._accounts[auth_ident].client
+
+        client = self.client_factory(auth_ident)
+        client.ensure_ratelimiter()
+        with self._cond:
+            if auth_ident not in self._accounts:
+                self._accounts[auth_ident] = _Account(client)
+                self._order.append(auth_ident)
+            self._accounts.move_to_end(auth_ident)
+            self._evict(keep=auth_ident)
+            return self._accounts[auth_ident].client
+
+    def submit(self, auth_ident, func, *args, priority=INTERACTIVE, **kwargs):
+        """
+        Schedules func(client, *args, **kwargs) call, returns Future.
+        """
+        if priority not in (INTERACTIVE, BULK):
+            raise ValueError('Unknown priority: %s' % priority)
+
+        future = Future()
+        while True:
+            client = self.get_client(auth_ident)
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError('Manager is closed')
+                account = self._accounts.get(auth_ident)
+                if account and account.client is client:  # not evicted meanwhile
+                    account.queues[priority].append((future, func, args, kwargs))
+                    self._cond.notify()
+                    return future
+
+    def call(self, auth_ident, func, *args, **kwargs):
+        return self.submit(auth_ident, func, *args, **kwargs).result()
+
+    def close(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _evict(self, keep=None):
+        for auth_ident in tuple(self._accounts):
+            if len(self._accounts) <= self.max_clients:
+                break
+            if auth_ident != keep and self._accounts[auth_ident].is_idle:
+                del self._accounts[auth_ident]
+                self._order.remove(auth_ident)
+
+    def _next_task(self):
+        for priority in (INTERACTIVE, BULK):
+            for i, auth_ident in enumerate(self._order):
+                account = self._accounts[auth_ident]
+                if account.queues[priority] and account.running < self.max_account_workers:
+                    # Moving account to the end of round-robin order
+                    del self._order[i]
+                    self._order.append(auth_ident)
+                    account.running += 1
+                    return account, account.queues[priority].popleft()
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                account, task = self._next_task()
+                while not task:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    account, task = self._next_task()
+
+            future, func, args, kwargs = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func(account.client, *args, **kwargs))
+                    except BaseException as exc:
+                        future.set_exception(exc)
+            finally:
+                with self._cond:
+                    account.running -= 1
+                    self._evict()
+                    # Account may have other tasks waiting for max_account_workers
+                    self._cond.notify_all()
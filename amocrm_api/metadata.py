@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+
+def _group_by(items, key):
+    rv = defaultdict(list)
+    for item in items:
+        value = key(item)
+        if value is not None:
+            rv[value].append(item)
+    return dict(rv)
+
+
+class EnumIndex:
+    """
+    Custom field enums by id and by value.
+    """
+    def __init__(self, enums):
+        self.by_id = {int(id): value for id, value in (enums or {}).items()}
+        self.by_value = _group_by(self.by_id, self.by_id.get)
+        self.values = frozenset(self.by_value)
+
+    @property
+    def is_unique(self):
+        return len(self.values) == len(self.by_id)
+
+    def get_value(self, id):
+        return self.by_id[int(id)]
+
+    def get_id(self, value):
+        ids = self.by_value.get(value, ())
+        if len(ids) != 1:
+            raise ValueError('Enum "%s" matched %s ids' % (value, len(ids)))
+        return ids[0]
+
+
+class CustomFieldsIndex:
+    """
+    Custom fields metadata of one model by id, code and name.
+    """
+    def __init__(self, metas):
+        self.by_id = {meta['id']: meta for meta in metas}
+        self.by_code = _group_by(self.by_id.values(), lambda m: m.get('code') or None)
+        self.by_name = _group_by(self.by_id.values(), lambda m: m['name'])
+        self.enums = {id: EnumIndex(meta['enums']) for id, meta in self.by_id.items()
+                      if meta.get('enums')}
+
+    def find(self, attr, value):
+        if attr == 'id':
+            return [self.by_id[value]] if value in self.by_id else []
+        return getattr(self, 'by_%s' % attr).get(value, [])
+
+
+class AccountIndex:
+    """
+    Lookup indexes for client.account_info, built once per account_info load.
+    """
+    def __init__(self, account_info):
+        self.custom_fields = {
+            model_plural_name: CustomFieldsIndex((metas or {}).values())
+            for model_plural_name, metas in (account_info.get('custom_fields') or {}).items()
+        }
+
+        users = {int(id): data for id, data in (account_info.get('users') or {}).items()}
+        self.user_ids_by_login = {data['login'].lower(): id for id, data in users.items()
+                                  if data.get('login')}
+        self.user_ids_by_email = {
+            (data.get('email') or data['login']).lower(): id for id, data in users.items()
+            if '@' in (data.get('email') or data.get('login') or '')
+        }
+
+        # Statuses 142 and 143 are in every pipeline, so we have (pipeline_id, status_id) pairs
+        statuses = [
+            (int(pipeline_id), int(id), status)
+            for pipeline_id, pipeline in (account_info.get('pipelines') or {}).items()
+            for id, status in pipeline['statuses'].items()
+        ]
+        self.statuses_by_id = {
+            id: [(p, i) for p, i, _ in items]
+            for id, items in _group_by(statuses, lambda s: s[1]).items()
+        }
+        self.statuses_by_name = {
+            name: [(p, i) for p, i, _ in items]
+            for name, items in _group_by(statuses, lambda s: s[2]['name']).items()
+        }
+
+    def get_custom_fields(self, model_plural_name):
+        return self.custom_fields.get(model_plural_name) or CustomFieldsIndex(())
+
+    def get_user_id(self, login=None, email=None):
+        if login:
+            return self.user_ids_by_login[login.lower()]
+        return self.user_ids_by_email[email.lower()]
+
+    def get_status_ids(self, id=None, name=None, pipeline_id=None):
+        """
+        Returns (pipeline_id, status_id) pairs matched by status id or name
+        """
+        rv = self.statuses_by_id.get(id, []) if id else self.statuses_by_name.get(name, [])
+        return [s for s in rv if pipeline_id is None or s[0] == pipeline_id]
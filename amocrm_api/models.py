@@ -1,8 +1,11 @@
-from marshmallow import Schema, fields
+from inspect import getattr_static
+from types import MethodType
+
+from marshmallow import Schema, fields, missing
 from requests_client.models import BindedEntityMixin, Entity, SchemedEntity
 from requests_client.schemas import DumpKeySchemaMixin
 from requests_client.fields import TimestampField
-from requests_client.utils import cached_property
+from requests_client.utils import cached_property, class_or_instance_property, repr_str_short
 
 from .constants import ELEMENT_TYPE
 from .utils import get_one
@@ -39,6 +42,20 @@ class Group(ClientMappedEntity):
     map_attr = 'groups'
 
 
+class _EntityMethod:
+    """
+    Class method on model and instance method (or None) on entity,
+    so entities don't need per-instance attributes for it.
+    """
+    def __init__(self, cls_method, instance_method=None):
+        self.cls_method, self.instance_method = cls_method, instance_method
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return MethodType(self.cls_method, cls)
+        return self.instance_method and MethodType(self.instance_method, obj)
+
+
 class BaseEntity(BindedEntityMixin, SchemedEntity):
     model_name = None
     model_plural_name = None
@@ -47,34 +64,224 @@ class BaseEntity(BindedEntityMixin, SchemedEntity):
     id = fields.Int(default=None)
     _links = fields.Raw()
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        def get():
-            if self.id is None:
-                raise ValueError('No id')
-            self.update(self.__class__.get_one(id=self.id))
-        self.get = get
-        self.get_one, self.get_iterator = None, None
-
-    @classmethod
-    def get(cls, *args, **kwargs):
+    def _get(cls, *args, **kwargs):
         return getattr(cls.client, 'get_%s' % cls.model_plural_name)(*args, **kwargs).data
 
-    @classmethod
-    def get_iterator(cls, *args, **kwargs):
+    def _refresh(self):
+        if self.id is None:
+            raise ValueError('No id')
+        self.update(self.__class__.get_one(id=self.id))
+
+    def _get_iterator(cls, *args, **kwargs):
         return getattr(cls.client, 'get_%s_iterator' % cls.model_plural_name)(*args, **kwargs)
 
-    @classmethod
-    def get_one(cls, *args, **kwargs):
+    def _get_one(cls, *args, **kwargs):
+        by_id = not args and tuple(kwargs) == ('id',) and isinstance(kwargs['id'], (int, str))
+        if cls.client.get_batcher and by_id:
+            future = cls.client.get_batcher.get(cls.model_plural_name, kwargs['id'])
+            return get_one(future.result())
         return get_one(cls.get(*args, **kwargs))
 
+    # Model.get(...) fetches entities, entity.get() refreshes entity
+    get = _EntityMethod(_get, _refresh)
+    get_iterator = _EntityMethod(_get_iterator)
+    get_one = _EntityMethod(_get_one)
+
     def save(self):
+        """
+        With client.write_behind enabled entity is buffered and future is returned
+        (see batching.WriteBehindQueue), errors are not raised, but set as future result.
+        """
+        if self.client.write_behind:
+            return self.client.write_behind.save(self)
         self.client.post_objects(add_or_update=[self], raise_on_errors=True)
 
     def delete(self):
+        # Returns future with client.write_behind enabled, same as save()
+        if self.client.write_behind:
+            return self.client.write_behind.delete(self)
         self.client.post_objects(delete=[self], raise_on_errors=True)
 
+    @classmethod
+    def get_compact_cls(cls):
+        """
+        Slotted class generated from model schema, see CompactEntity.
+        """
+        if '_compact_cls' not in cls.__dict__:
+            if isinstance(cls.schema, CustomFieldsSchemaMixin):
+                # Binded custom fields are removed from schema on binding
+                cls.schema._maybe_bind_custom_fields(None)
+            cls._compact_cls = type('Compact%s' % cls.__name__, (CompactEntity,), {
+                '__slots__': tuple(cls.schema.fields),
+                'model': cls,
+                'model_name': cls.model_name,
+                'model_plural_name': cls.model_plural_name,
+            })
+        return cls._compact_cls
+
+    @classmethod
+    def load_compact(cls, data, many=False, **kwargs):
+        compact_cls = cls.get_compact_cls()
+        if not many:
+            return compact_cls(**cls.schema.load(data, **kwargs))
+        return tuple(compact_cls(**item) for item in cls.schema.load(data, many=True, **kwargs))
+
+    @classmethod
+    def get_lazy_cls(cls):
+        """
+        Model subclass with fields deserialized on first access, see LazyEntityMixin.
+        """
+        if '_lazy_cls' not in cls.__dict__:
+            if isinstance(cls.schema, CustomFieldsSchemaMixin):
+                cls.schema._maybe_bind_custom_fields(None)
+            attrs = {name: _LazyField(name, field) for name, field in cls.schema.fields.items()}
+            attrs.update(model=cls, __module__=cls.__module__)
+            # Skipping SchemedEntityMeta, lazy class shares schema with model
+            cls._lazy_cls = type.__new__(type(cls), 'Lazy%s' % cls.__name__,
+                                         (LazyEntityMixin, cls), attrs)
+        return cls._lazy_cls
+
+    @classmethod
+    def load_lazy(cls, data, many=False):
+        if isinstance(cls.schema, CustomFieldsSchemaMixin):
+            cls.schema._maybe_bind_custom_fields(None)
+        lazy_cls = cls.get_lazy_cls()
+        if not many:
+            return lazy_cls.from_raw(data)
+        return tuple(lazy_cls.from_raw(item) for item in data)
+
+
+class _LazyField:
+    # Non-data descriptor, so deserialized (or set) value in instance __dict__ wins
+    def __init__(self, name, field):
+        self.name, self.field = name, field
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return missing
+        key = self.field.data_key or self.name
+        if key not in obj._raw:
+            value = self.field.default
+        elif isinstance(self.field, custom_fields._CustomFields):
+            value = self.field.deserialize_lazy(obj._raw[key], self.name, obj._raw)
+        else:
+            value = self.field.deserialize(obj._raw[key], self.name, obj._raw)
+        obj.__dict__[self.name] = value
+        return value
+
+
+class LazyEntityMixin:
+    """
+    Entity keeping raw item, with fields (and custom fields) deserialized
+    on first access, created with model.load_lazy().
+    Deserialization errors are raised on access, not on load.
+    Custom fields not accessed are dumped raw.
+    """
+    model = None
+
+    @classmethod
+    def from_raw(cls, item):
+        rv = cls.__new__(cls)
+        rv._raw = item
+        return rv
+
+    def update(self, other):
+        if not isinstance(other, self.model):
+            return super().update(other)
+        for name in self.schema.fields:
+            setattr(self, name, getattr(other, name))
+
+
+class CompactEntity:
+    """
+    Base of slotted entities (without per-instance __dict__) generated from model schema
+    with model.get_compact_cls(). Custom fields are stored in array based container.
+    Model properties (binded custom fields, responsible_user, etc) are proxied,
+    so it's mostly compatible with model entity, use to_entity() otherwise.
+    """
+    __slots__ = ('_meta',)
+    model = None
+    model_name = None
+    model_plural_name = None
+
+    def __init__(self, **kwargs):
+        for name, field in self.model.schema.fields.items():
+            if field.default is not missing:
+                kwargs.setdefault(name, field.default)
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def __getattr__(self, name):
+        # Called only if slot is not set or attribute is model property
+        if name in self.model.schema.fields:
+            return missing
+        prop = getattr_static(self.model, name, None)
+        if isinstance(prop, property):
+            return prop.__get__(self, self.__class__)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name == 'custom_fields' and isinstance(value, custom_fields._CustomFieldsData):
+            value = custom_fields._CompactCustomFieldsData(value)
+        try:
+            object.__setattr__(self, name, value)
+        except AttributeError:
+            prop = getattr_static(self.model, name, None)
+            if not isinstance(prop, property):
+                raise
+            prop.__set__(self, value)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    @property
+    def meta(self):
+        try:
+            return self._meta
+        except AttributeError:
+            self._meta = {}
+            return self._meta
+
+    @class_or_instance_property
+    def client(cls_or_self):
+        return cls_or_self.model.client
+
+    @property
+    def _fields(self):
+        return self.model.schema.fields
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__
+                if getattr(self, name) is not missing}
+
+    def to_entity(self):
+        rv = self.model(**self.to_dict())
+        if 'error' in self.meta:
+            rv.meta.update(self.meta)
+        return rv
+
+    def update(self, other):
+        for name in self.__slots__:
+            value = getattr(other, name, missing)
+            if value is not missing:
+                setattr(self, name, value)
+
+    def dump(self, **kwargs):
+        return self.model.schema.dump(self, **kwargs)
+
+    def get(self):
+        if self.id is None:
+            raise ValueError('No id')
+        self.update(self.model.get_one(id=self.id))
+
+    save = BaseEntity.save
+    delete = BaseEntity.delete
+
+    def __repr__(self):
+        return '<%s(%s)>' % (self.__class__.__name__, ', '.join(
+            '%s=%s' % (k, repr_str_short(repr(v))) for k, v in self.to_dict().items()
+        ))
+
 
 class __CreatedUpdated:
     created_by_id = UserIdField(bind_attr='created_by', data_key='created_by')
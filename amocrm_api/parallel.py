@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full, Empty
+from threading import Lock, Event
+from time import monotonic
+
+try:
+    from gevent import sleep
+except ImportError:
+    from time import sleep
+
+
+class RateLimiter:
+    """
+    Thread safe limiter for requests count per period (seconds),
+    shared between all threads using same client.
+    """
+
+    def __init__(self, rate, period=1):
+        self.rate, self.period = rate, period
+        self._interval = float(period) / rate
+        self._next_time = monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = monotonic()
+            # Allowing burst of "rate" requests after idle period
+            self._next_time = max(self._next_time, now - self.period + self._interval)
+            wait_seconds = self._next_time - now
+            self._next_time += self._interval
+        if wait_seconds > 0:
+            sleep(wait_seconds)
+        return wait_seconds
+
+
+_DONE = object()
+
+
+class _Error:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def iterate_concurrently(iterables, workers=4, queue_size=1000):
+    """
+    Iterates over iterables in thread pool, yielding items in order they were fetched.
+    Exception in any iterable stops others and raised to consumer.
+    Queue size limits items fetched, but not yet consumed.
+    """
+
+    iterables = tuple(iterables)
+    queue, stop = Queue(maxsize=queue_size), Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                return queue.put(item, timeout=0.1)
+            except Full:
+                pass
+
+    def worker(iterable):
+        try:
+            if not stop.is_set():
+                for item in iterable:
+                    put(item)
+                    if stop.is_set():
+                        break
+        except Exception as exc:
+            put(_Error(exc))
+        finally:
+            put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for iterable in iterables:
+            executor.submit(worker, iterable)
+
+        done = 0
+        while done < len(iterables):
+            try:
+                item = queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if item is _DONE:
+                done += 1
+            elif isinstance(item, _Error):
+                raise item.exc
+            else:
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
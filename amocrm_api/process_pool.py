@@ -0,0 +1,136 @@
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .iterators import ObjectsFetchIterator
+from .utils import get_one
+from . import serialization
+
+
+_client = None  # process pool worker client
+
+
+def _init_worker(client_cls, login, hash, subdomain, account_info, skip_unknown_custom_fields):
+    global _client
+    # Worker never makes requests, it only needs binded models and account_info,
+    # so account_info is not reloaded on custom fields changes
+    _client = client_cls(login, hash, subdomain, ratelimit=0, load_state=False,
+                         state_storage=False)
+    _client.__dict__['account_info'] = account_info
+    _client.custom_fields_refresh_seconds = None
+    _client.custom_fields_refresh_min_seconds = None
+    _client.skip_unknown_custom_fields = skip_unknown_custom_fields
+
+
+def _load_page(model_name, items, compact):
+    objs = _client.models[model_name].load(items, many=True)
+    if compact:
+        return [serialization.dumps(obj) for obj in objs]
+    return serialization.dumps(objs)
+
+
+def create_process_pool(client, processes=None):
+    """
+    Process pool for loading pages of client models, may be shared between iterators.
+    NOTE: worker client is created from client class, so models binded
+    with client.bind_model after client creation are not available in workers.
+    """
+    return ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(
+        client.__class__, client.login, client.hash, client.subdomain,
+        client.account_info, client.skip_unknown_custom_fields,
+    ))
+
+
+def _shutdown(pending, io_pool, process_pool):
+    while pending:
+        pending.pop().cancel()
+    io_pool.shutdown(wait=False)
+    if process_pool is not None:
+        process_pool.shutdown(wait=False)
+
+
+class ProcessPoolFetchIterator(ObjectsFetchIterator):
+    """
+    ObjectsFetchIterator with raw pages fetched concurrently in io_workers threads
+    (within client ratelimit) and loaded in process pool, so scan is not limited
+    by one core busy with model.load.
+    Pages are yielded in order, at most max_pending_pages are fetched or loaded
+    ahead of consumer.
+    With compact=True entities are yielded as serialization.dumps bytes,
+    otherwise they are reconstructed in current process (which is cheaper than load).
+    process_pool - number of processes or executor from create_process_pool.
+
+    Thread pool and own process pool are shut down after last page, on close(),
+    or when iterator is garbage collected, so if iteration may be stopped early
+    use iterator as context manager (or call close()) to free them at once:
+
+        with client.get_leads_iterator(process_pool=4) as iterator:
+            for lead in iterator:
+                ...
+    """
+
+    def __init__(self, client, model, filters={}, process_pool=True, io_workers=2,
+                 max_pending_pages=8, compact=False, **kwargs):
+        if kwargs.get('consistent') or kwargs.get('page_size'):
+            raise ValueError('consistent and page_size are not supported with process_pool')
+        super().__init__(client, model, filters, **kwargs)
+
+        self.model_name = get_one(name for name, m in client.models.items()
+                                  if getattr(m, 'model_plural_name', None) == model)
+        self.compact = compact
+        self.max_pending_pages = max_pending_pages
+        self._own_process_pool = not isinstance(process_pool, ProcessPoolExecutor)
+        self.process_pool = (
+            create_process_pool(client, None if process_pool is True else process_pool)
+            if self._own_process_pool else process_pool
+        )
+        client.ensure_ratelimiter()
+        self._io_pool = ThreadPoolExecutor(io_workers)
+        self._pending = deque()  # futures of (fetched count, load future) in cursor order
+        self._next_cursor = self.cursor
+        self._end_cursor = None  # cursor after last page, known on first short page
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self._pending, self._io_pool,
+            self.process_pool if self._own_process_pool else None
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _fetch_page(self, cursor):
+        with self.client.raw_objects():
+            items = self.get_page(cursor)[0]
+        if len(items) < self.cursor_count:
+            end_cursor = cursor + len(items)
+            if self._end_cursor is None or end_cursor < self._end_cursor:
+                self._end_cursor = end_cursor
+        return len(items), self.process_pool.submit(_load_page, self.model_name, items,
+                                                    self.compact)
+
+    def _fetch(self):
+        self._maybe_checkpoint()
+        try:
+            while len(self._pending) < self.max_pending_pages and (
+                    self._end_cursor is None or self._next_cursor < self._end_cursor):
+                self._pending.append(self._io_pool.submit(self._fetch_page, self._next_cursor))
+                self._next_cursor += self.cursor_count
+
+            count, future = self._pending.popleft().result()
+            data = future.result()
+        except BaseException:
+            self.close()
+            raise
+
+        self.has_more = count >= self.cursor_count
+        self.cursor += count
+        if not self.has_more:
+            self.close()
+        if self.compact:
+            return data
+        return serialization.loads(data, self.client)
+
+    def close(self):
+        self._finalizer()
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from random import uniform
+
+from requests.exceptions import Timeout, ConnectionError
+from requests_client.exceptions import HTTPError
+from requests_client.utils import utcnow
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter for temporary errors (timeouts, connection
+    errors and http statuses), honoring Retry-After response header.
+    """
+
+    def __init__(self, retries=3, backoff_seconds=1, backoff_factor=2,
+                 max_backoff_seconds=60, jitter=0.5, statuses=(429, 500, 502, 503, 504)):
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_factor = backoff_factor
+        self.max_backoff_seconds = max_backoff_seconds
+        self.jitter = jitter  # part of backoff to randomize
+        self.statuses = statuses
+
+    def is_retryable(self, exc):
+        if isinstance(exc, (Timeout, ConnectionError)):
+            return True
+        return isinstance(exc, HTTPError) and exc.status in self.statuses
+
+    def should_retry(self, exc, attempt):
+        # attempt - number of retries already made
+        return attempt < self.retries and self.is_retryable(exc)
+
+    def get_retry_after(self, exc):
+        resp = getattr(exc, 'resp', None)
+        value = resp is not None and resp.headers.get('Retry-After')
+        if not value:
+            return None
+        if value.isdigit():
+            return int(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(retry_at, datetime):
+            return None
+        if not retry_at.tzinfo:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0, (retry_at - utcnow()).total_seconds())
+
+    def get_wait_seconds(self, attempt, exc=None):
+        retry_after = self.get_retry_after(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff_seconds)
+        backoff = min(self.backoff_seconds * self.backoff_factor ** (attempt - 1),
+                      self.max_backoff_seconds)
+        return backoff * (1 - self.jitter) + uniform(0, backoff * self.jitter)
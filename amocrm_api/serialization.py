@@ -0,0 +1,162 @@
+"""
+Compact serialization of entities (with nested entities and custom fields values)
+for process pools and caches, without pickling client binding.
+
+Values are encoded to tree of primitives with tagged lists for containers and known types,
+which is packed with msgpack if installed, or with marshal otherwise
+(marshal format is python version specific, so it's fine for process pools,
+but not for long living shared caches).
+"""
+import marshal
+from datetime import date, datetime, timedelta, timezone
+
+from marshmallow import missing
+from multidict import MultiDict
+from requests_client.utils import cached_property
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .models import BaseEntity, CompactEntity, LazyEntityMixin, PipelineStatus
+from .custom_fields import (SmartAddress, LegalEntity, _CustomFieldsData,
+                            _CompactCustomFieldsData)
+
+
+(_LIST, _TUPLE, _DICT, _SET, _DATETIME, _DATE, _MULTIDICT, _CUSTOM_FIELDS, _MODEL, _ENTITY,
+ _COMPACT) = range(11)
+
+# Entities not binded to client, reconstructed by class name
+_ENTITY_CLASSES = (PipelineStatus, SmartAddress, LegalEntity)
+_ENTITIES = {cls.__name__: cls for cls in _ENTITY_CLASSES}
+
+_MSGPACK, _MARSHAL = b'M', b'S'
+
+
+def _get_attrs(obj):
+    if isinstance(obj, LazyEntityMixin):
+        # Deserializing not accessed fields, raw item is not kept
+        return ((k, getattr(obj, k)) for k in obj.schema.fields
+                if getattr(obj, k) is not missing)
+    if hasattr(obj, '__slots__'):
+        return ((k, getattr(obj, k)) for k in obj.__slots__ if hasattr(obj, k))
+    cls = obj.__class__
+    return (
+        (k, v) for k, v in obj.__dict__.items()
+        # cached properties (like note.element) are not data and will be fetched again
+        if not isinstance(getattr(cls, k, None), cached_property)
+    )
+
+
+def _encode_items(tag, items, *head):
+    rv = [tag, *head]
+    for k, v in items:
+        rv.append(_encode(k))
+        rv.append(_encode(v))
+    return rv
+
+
+def _encode(value):
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, BaseEntity):
+        return _encode_items(_MODEL, _get_attrs(value), value.model_name)
+    if isinstance(value, CompactEntity):
+        return _encode_items(_COMPACT, value.to_dict().items(), value.model_name)
+    if isinstance(value, (_CustomFieldsData, _CompactCustomFieldsData)):
+        return _encode_items(_CUSTOM_FIELDS, value.data.items())
+    if isinstance(value, MultiDict):
+        return _encode_items(_MULTIDICT, value.items())
+    if isinstance(value, dict):
+        return _encode_items(_DICT, value.items())
+    if isinstance(value, list):
+        return [_LIST, *map(_encode, value)]
+    if isinstance(value, tuple):
+        return [_TUPLE, *map(_encode, value)]
+    if isinstance(value, (set, frozenset)):
+        return [_SET, *map(_encode, value)]
+    if isinstance(value, datetime):
+        offset = value.utcoffset()
+        return [_DATETIME, value.replace(tzinfo=None).isoformat(),
+                offset.total_seconds() if offset is not None else None]
+    if isinstance(value, date):
+        return [_DATE, value.toordinal()]
+    if isinstance(value, _ENTITY_CLASSES):
+        return _encode_items(_ENTITY, _get_attrs(value), value.__class__.__name__)
+    raise TypeError('Type %s not serializable' % type(value))
+
+
+def _decode(data, client):
+    if not isinstance(data, (list, tuple)):
+        return data
+    tag = data[0]
+    if tag == _LIST:
+        return [_decode(v, client) for v in data[1:]]
+    if tag == _TUPLE:
+        return tuple(_decode(v, client) for v in data[1:])
+    if tag == _SET:
+        return set(_decode(v, client) for v in data[1:])
+    if tag == _DICT:
+        return {_decode(data[i], client): _decode(data[i + 1], client)
+                for i in range(1, len(data), 2)}
+    if tag == _MULTIDICT:
+        return MultiDict((_decode(data[i], client), _decode(data[i + 1], client))
+                         for i in range(1, len(data), 2))
+    if tag == _DATETIME:
+        rv = datetime.fromisoformat(data[1])
+        if data[2] is not None:
+            rv = rv.replace(tzinfo=timezone(timedelta(seconds=data[2])))
+        return rv
+    if tag == _DATE:
+        return date.fromordinal(data[1])
+    if tag in (_MODEL, _COMPACT):
+        model = client.models[data[1]]
+        attrs = {}
+        for i in range(2, len(data), 2):
+            if data[i] == 'custom_fields':
+                attrs['custom_fields'] = _decode_custom_fields(data[i + 1], model, client)
+            else:
+                attrs[data[i]] = _decode(data[i + 1], client)
+        return model(**attrs) if tag == _MODEL else model.get_compact_cls()(**attrs)
+    if tag == _ENTITY:
+        return _ENTITIES[data[1]](**{data[i]: _decode(data[i + 1], client)
+                                     for i in range(2, len(data), 2)})
+    raise ValueError('Unknown tag %s' % tag)
+
+
+def _decode_custom_fields(data, model, client):
+    if not isinstance(data, (list, tuple)) or data[0] != _CUSTOM_FIELDS:
+        return _decode(data, client)
+    field = model.schema.fields['custom_fields']
+    if field.data_cls is None:
+        model.schema._maybe_bind_custom_fields(None)
+    return field.data_cls({_decode(data[i], client): _decode(data[i + 1], client)
+                           for i in range(1, len(data), 2)})
+
+
+def dumps(value, use_msgpack=None):
+    """
+    Serializes entity, or any structure (list of entities for example) of entities
+    and primitives, to bytes.
+    """
+    use_msgpack = msgpack is not None if use_msgpack is None else use_msgpack
+    if use_msgpack:
+        if msgpack is None:
+            raise RuntimeError('msgpack is required to dump with use_msgpack')
+        return _MSGPACK + msgpack.packb(_encode(value), use_bin_type=True)
+    return _MARSHAL + marshal.dumps(_encode(value))
+
+
+def loads(data, client):
+    """
+    Reconstructs value serialized with dumps, binding entities to client models.
+    """
+    codec, data = data[:1], data[1:]
+    if codec == _MSGPACK:
+        if msgpack is None:
+            raise RuntimeError('msgpack is required to load this data')
+        return _decode(msgpack.unpackb(data, raw=False), client)
+    if codec == _MARSHAL:
+        return _decode(marshal.loads(data), client)
+    raise ValueError('Unknown codec: %r' % codec)
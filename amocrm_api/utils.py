@@ -1,3 +1,9 @@
+import json
+from calendar import timegm
+from datetime import datetime
+from enum import Enum
+
+
 def get_one(items, match=lambda x: True):
     matched = tuple(x for x in items if match(x))
     if len(matched) != 1:
@@ -5,7 +11,60 @@ def get_one(items, match=lambda x: True):
     return matched[0]
 
 
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def maybe_qs_list(data):
     if isinstance(data, (tuple, list)):
         return ','.join(map(str, data)) or None  # in case empty list
     return data
+
+
+def range_filter_params(name, bounds):
+    """
+    Returns filter[name][from] and filter[name][to] params (timestamps)
+    for bounds (from, to) of datetimes (naive are considered utc) or dates,
+    None bounds are skipped.
+    """
+    rv = {}
+    for key, value in zip(('from', 'to'), bounds or ()):
+        if value is None:
+            continue
+        if isinstance(value, datetime) and value.tzinfo:
+            value = int(value.timestamp())
+        else:
+            value = timegm(value.timetuple())  # date as utc midnight
+        rv['filter[%s][%s]' % (name, key)] = value
+    return rv
+
+
+def _token_default(obj):
+    if isinstance(obj, datetime):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError('Type %s not serializable' % type(obj))
+
+
+def _token_object_hook(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def dump_token(state):
+    return json.dumps(state, default=_token_default, separators=(',', ':'), sort_keys=True)
+
+
+def load_token(token):
+    return json.loads(token, object_hook=_token_object_hook)
@@ -0,0 +1,59 @@
+"""
+Memory used by loaded contacts, regular entities vs compact (slotted) entities.
+Client is not making requests, synthetic account_info and items are used.
+
+    python benchmarks/memory.py [count]
+"""
+import os
+import sys
+import gc
+import tracemalloc
+
+# Offline client of tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'tests'))
+from conftest import create_offline_client  # noqa: E402
+
+
+def contact(i):
+    return {
+        'id': i, 'name': 'Contact %d' % i, 'responsible_user_id': 1, 'created_by': 1,
+        'created_at': 1500000000 + i, 'updated_at': 1500000000 + i, 'updated_by': 1,
+        'account_id': 1, 'group_id': 0, 'leads': {'id': [i, i + 1]}, 'company': {},
+        'tags': [], 'closest_task_at': 0,
+        'custom_fields': [
+            {'id': 1, 'values': [{'value': '+7 900 %07d' % i, 'enum': '1'}]},
+            {'id': 2, 'values': [{'value': 'contact%d@example.com' % i, 'enum': '3'}]},
+            {'id': 5, 'values': [{'value': 'benchmark'}]},
+        ],
+    }
+
+
+def measure(load, items):
+    gc.collect()
+    tracemalloc.start()
+    objs = load(items, many=True)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return size
+
+
+def main(count=10000):
+    client = create_offline_client(custom_fields={'contacts': {
+        '5': {'id': 5, 'name': 'Source', 'code': None, 'field_type': 1, 'enums': None},
+    }})
+    model = client.contact
+    items = [contact(i) for i in range(1, count + 1)]
+    model.load(items[:1], many=True)  # binding custom fields before measure
+    model.load_compact(items[:1], many=True)
+
+    regular = measure(model.load, items)
+    compact = measure(model.load_compact, items)
+    print('%d contacts' % count)
+    print('regular: %8.1f KiB, %5d bytes per entity' % (regular / 1024, regular / count))
+    print('compact: %8.1f KiB, %5d bytes per entity (%.0f%%)' %
+          (compact / 1024, compact / count, compact / regular * 100))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -25,4 +25,8 @@ setup(
     keywords='',
     packages=find_packages(),
     install_requires=requires,
+    extras_require={
+        'msgpack': ['msgpack'],  # faster and portable serialization format
+        'columnar': ['numpy', 'pandas', 'pyarrow'],
+    },
 )
@@ -1,4 +1,5 @@
 import pytest
+from requests_client.utils import maybe_attr_dict
 
 from amocrm_api import AmocrmClient
 
@@ -14,3 +15,46 @@ def client():
     if 'account_info' not in cl.__dict__:
         cl.__dict__['account_info'] = AmocrmClient._account_info
     yield cl
+
+
+def create_offline_client(auth_ident='login:test', custom_fields={}, field_ids_offset=0,
+                          **kwargs):
+    """
+    Client not making requests, authenticated with fake session and with synthetic
+    account_info: contacts have system custom fields (PHONE, EMAIL, POSITION, IM)
+    with ids from field_ids_offset + 1, custom_fields are added by model plural name.
+    """
+    login, subdomain = auth_ident.split(':')
+    client = AmocrmClient(login, 'hash', subdomain, load_state=False, state_storage=False,
+                          **kwargs)
+    client.cookies.set('session_id', 'test')
+    contacts_fields = {
+        str(field_ids_offset + i): {'id': field_ids_offset + i, 'name': code.title(),
+                                    'code': code, 'field_type': field_type, 'enums': enums}
+        for i, (code, field_type, enums) in enumerate((
+            ('PHONE', 8, {'1': 'WORK', '2': 'MOB'}), ('EMAIL', 8, {'3': 'WORK', '4': 'PRIV'}),
+            ('POSITION', 1, None), ('IM', 8, {'5': 'SKYPE'}),
+        ), 1)
+    }
+    client.__dict__['account_info'] = maybe_attr_dict({
+        'id': field_ids_offset + 1, 'subdomain': subdomain, 'current_user': 1,
+        'custom_fields': {
+            model: dict(contacts_fields if model == 'contacts' else {},
+                        **custom_fields.get(model, {}))
+            for model in ('contacts', 'leads', 'companies', 'customers')
+        },
+        'users': {'1': {'id': 1, 'name': 'User', 'login': 'user@example.com', 'group_id': 0}},
+        'groups': [{'id': 0, 'name': 'Group'}],
+        'pipelines': {},
+    })
+    return client
+
+
+@pytest.fixture()
+def offline_client_factory():
+    return create_offline_client
+
+
+@pytest.fixture()
+def offline_client():
+    return create_offline_client()
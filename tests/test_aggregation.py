@@ -0,0 +1,17 @@
+from amocrm_api.aggregation import LeadsAggregation, aggregate_leads
+
+
+def test_aggregate_leads(client):
+    leads = [client.lead(name='__TEST_LEAD%s' % i, sale=100 * (i + 1)) for i in range(3)]
+    client.post_objects(leads)
+
+    ids = [lead.id for lead in leads]
+    aggregation = aggregate_leads(client, LeadsAggregation(('pipeline_id',)), id=ids)
+    row, = aggregation.results(client=client)
+    assert row['count'] == 3 and row['sum'] == 600
+    assert row['pipeline_name']
+
+    entities = LeadsAggregation(('pipeline_id',)).extend(client.get_leads_iterator(id=ids))
+    assert entities.results() == aggregation.results()
+
+    client.post_objects(delete=leads)
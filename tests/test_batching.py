@@ -0,0 +1,194 @@
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from time import sleep
+from types import SimpleNamespace
+
+import pytest
+
+from amocrm_api.batching import GetBatcher, WriteBehindQueue
+
+
+Entity = namedtuple('Entity', 'id')
+
+
+class FakeClient:
+    def __init__(self, ids, error=None):
+        self.ids = set(ids)
+        self.error = error
+        self.calls = []
+        self._lock = Lock()
+
+    def get_leads(self, id):
+        with self._lock:
+            self.calls.append(sorted(id))
+        if self.error:
+            raise self.error
+        return SimpleNamespace(data=[Entity(id_) for id_ in id if id_ in self.ids])
+
+
+def test_get_batcher():
+    client = FakeClient([1, 2, 3])
+    batcher = GetBatcher(client, window_seconds=0.05)
+    futures = [batcher.get('leads', id) for id in (1, 2, 2, '3', 4)]
+    results = [future.result(timeout=1) for future in futures]
+
+    # One request for all ids of window, results are fanned out to callers
+    assert client.calls == [[1, 2, 3, 4]]
+    assert results == [[Entity(1)], [Entity(2)], [Entity(2)], [Entity(3)], []]
+    assert results[1][0] is results[2][0]
+
+    # Next window is new batch
+    assert batcher.get('leads', 1).result(timeout=1) == [Entity(1)]
+    assert client.calls == [[1, 2, 3, 4], [1]]
+
+
+def test_get_batcher_max_batch():
+    client = FakeClient(range(10))
+    batcher = GetBatcher(client, window_seconds=10, max_batch=3)
+    futures = [batcher.get('leads', id) for id in range(3)]
+    # Full batch is dispatched without waiting for window
+    assert all(future.done() for future in futures)
+    assert client.calls == [[0, 1, 2]]
+
+
+def test_get_batcher_error():
+    client = FakeClient([1], error=ValueError('failed'))
+    batcher = GetBatcher(client, window_seconds=0.05)
+    futures = [batcher.get('leads', id) for id in (1, 2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=1)
+    assert client.calls == [[1, 2]]
+
+
+def test_get_one_batched(offline_client_factory):
+    client = offline_client_factory(get_batcher=GetBatcher(None, window_seconds=0.05))
+    client.get_batcher.client = fake = FakeClient([1, 2])
+    client.get_leads = fake.get_leads
+
+    with ThreadPoolExecutor(4) as executor:
+        leads = list(executor.map(lambda id: client.lead.get_one(id=id), (1, 2, 1, 2)))
+    assert leads == [Entity(1), Entity(2), Entity(1), Entity(2)]
+    assert fake.calls == [[1, 2]]
+
+    # Not single id lookups are not batched
+    assert client.lead.get_one(id=[2]) == Entity(2)
+    assert fake.calls == [[1, 2], [2]]
+    with pytest.raises(IndexError):
+        client.lead.get_one(id=3)
+
+
+class Obj:
+    def __init__(self, id=None, error=None):
+        self.id = id
+        self.meta = {'error': error} if error else {}
+
+
+class FakePostClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.posted = []
+
+    def post_objects(self, add_or_update=[], delete=[]):
+        if self.error:
+            raise self.error
+        self.posted.append((add_or_update, delete))
+
+
+def test_write_behind_flush():
+    client = FakePostClient()
+    queue = WriteBehindQueue(client, max_size=10, max_delay_seconds=10)
+    new, failed, updated, deleted = Obj(), Obj(2, error='Invalid'), Obj(1), Obj(3)
+    futures = [queue.save(new), queue.save(failed), queue.save(updated),
+               queue.delete(deleted)]
+    assert not client.posted and not any(future.done() for future in futures)
+
+    queue.flush()
+    # Buffered entities are posted with one request, in order they were buffered
+    assert client.posted == [([new, failed, updated], [deleted])]
+    assert [future.result() for future in futures] == [None, 'Invalid', None, None]
+
+    queue.flush()
+    assert len(client.posted) == 1
+
+
+def test_write_behind_merge():
+    client = FakePostClient()
+    queue = WriteBehindQueue(client, max_size=10, max_delay_seconds=10)
+    first, last = Obj(1), Obj(1)
+    futures = [queue.save(first), queue.save(Obj(2)), queue.save(last)]
+    # Entities with same id are merged, last one is posted
+    assert futures[0] is futures[2]
+    queue.flush()
+    add = client.posted[0][0]
+    assert len(add) == 2 and add[0] is last and add[1].id == 2
+
+    with pytest.raises(ValueError):
+        queue.delete(Obj())
+
+
+def test_write_behind_triggers():
+    client = FakePostClient()
+    queue = WriteBehindQueue(client, max_size=2, max_delay_seconds=0.05)
+    queue.save(Obj(1))
+    # Flushed in caller thread when max_size entities are buffered
+    future = queue.save(Obj(2))
+    assert future.done() and len(client.posted) == 1
+
+    # Flushed by timer after max_delay_seconds
+    future = queue.save(Obj(3))
+    assert future.result(timeout=1) is None
+    assert [obj.id for obj in client.posted[1][0]] == [3]
+
+
+def test_write_behind_batches_order():
+    client = FakePostClient()
+    queue = WriteBehindQueue(client, max_size=3, max_delay_seconds=10)
+    for id in range(10):
+        queue.save(Obj(id))
+    queue.flush()
+    assert [[obj.id for obj in add] for add, _ in client.posted] == [
+        [0, 1, 2], [3, 4, 5], [6, 7, 8], [9]
+    ]
+
+    # Concurrent flushes are serialized, every entity is posted once
+    client.posted = []
+
+    def save(id):
+        sleep(0.001 * (id % 3))
+        return queue.save(Obj(id))
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = list(executor.map(save, range(30)))
+    queue.flush()
+    assert all(future.result(timeout=1) is None for future in futures)
+    assert sorted(obj.id for add, _ in client.posted for obj in add) == list(range(30))
+    assert all(len(add) <= 3 for add, _ in client.posted)
+
+
+def test_write_behind_error():
+    client = FakePostClient(error=ValueError('failed'))
+    queue = WriteBehindQueue(client, max_size=10, max_delay_seconds=10)
+    futures = [queue.save(Obj(1)), queue.delete(Obj(2))]
+    queue.flush()
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+
+    # Queue is usable after error
+    client.error = None
+    future = queue.save(Obj(1))
+    queue.close()
+    assert future.result() is None
+
+
+def test_save_write_behind(offline_client_factory):
+    client = offline_client_factory(write_behind=WriteBehindQueue(None, max_delay_seconds=10))
+    client.write_behind.client = fake = FakePostClient()
+    lead = client.lead(name='Lead')
+    future = lead.save()
+    assert isinstance(future, Future) and not fake.posted
+    client.write_behind.flush()
+    assert fake.posted == [([lead], [])]
+    assert future.result() is None
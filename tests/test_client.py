@@ -1,4 +1,9 @@
-from amocrm_api.constants import LEAD_STATUS, FIELD_TYPE, ELEMENT_TYPE
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+from amocrm_api.constants import LEAD_STATUS, FIELD_TYPE, ELEMENT_TYPE, NOTE_TYPE
 from amocrm_api.custom_fields import CUSTOM_FIELD_MAP
 
 
@@ -7,6 +12,15 @@ def test_account_info(client):
     assert client.login == client.current_user.login
 
 
+def test_account_index(client):
+    assert client.get_user(login=client.login) is client.current_user
+    pipeline, *_ = client.pipelines.values()
+    status = client.get_status(id=LEAD_STATUS.SUCCESS.value, pipeline_id=pipeline.id)
+    assert status is pipeline.statuses[LEAD_STATUS.SUCCESS.value]
+    for meta in client.account_info.custom_fields.contacts.values():
+        assert client.account_index.get_custom_fields('contacts').by_id[meta.id] is meta
+
+
 def test_contact(client):
     contact = client.contact(name='__TEST_CONTACT', tags=['x', 'y'])
     assert not contact.id
@@ -100,3 +114,230 @@ def test_post_custom_fields(client):
     custom_fields = client.account_info.custom_fields
     for field in fields:
         assert not custom_fields.contacts.get(str(fields[i].metadata['id']))
+
+
+def test_unknown_custom_field(offline_client):
+    client = offline_client
+    account_info, reloads = client.account_info, []
+    client.get_account_info = lambda: reloads.append(1) or SimpleNamespace(data=account_info)
+    data = {'id': 1, 'name': 'Contact',
+            'custom_fields': [{'id': 99, 'values': [{'value': 'x'}]}]}
+
+    client.custom_fields_refresh_min_seconds = None
+    with pytest.raises(KeyError):
+        client.contact.load(data)
+    assert not reloads
+
+    # Unknown field is reloaded once per custom_fields_refresh_min_seconds
+    client.custom_fields_refresh_min_seconds = 60
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            client.contact.load(data)
+    assert len(reloads) == 1
+
+    client.skip_unknown_custom_fields = True
+    assert not client.contact.load(data).custom_fields
+
+
+def test_refresh_custom_fields(client):
+    client.get_contacts(cursor_count=1)  # binding custom fields
+    field = CUSTOM_FIELD_MAP[FIELD_TYPE.TEXT](name='__TEST_CUSTOM_FIELD_REFRESH',
+                                              element_type=ELEMENT_TYPE.CONTACT)
+    client.post_custom_fields(add=[field])
+    try:
+        assert client.refresh_custom_fields() == {'contacts'}
+        assert field.metadata['id'] in client.contact.schema.fields['custom_fields'].custom_fields
+        assert client.refresh_custom_fields(max_age_seconds=60) == set()
+    finally:
+        client.post_custom_fields(delete=[field])
+
+
+def test_notes_by_elements(client):
+    leads = [client.lead(name='__TEST_LEAD%s' % i) for i in range(2)]
+    client.post_objects(leads)
+    notes = [client.note(element_type=ELEMENT_TYPE.LEAD, element_id=lead.id,
+                         note_type=NOTE_TYPE.COMMON, text='__TEST_NOTE') for lead in leads]
+    client.post_objects(notes)
+
+    by_elements = client.get_notes_by_elements(ELEMENT_TYPE.LEAD, [lead.id for lead in leads],
+                                               note_type=NOTE_TYPE.COMMON, chunk_size=1)
+    for lead, note in zip(leads, notes):
+        assert note.id in [n.id for n in by_elements[lead.id]]
+
+    ids = set(n.id for n in client.get_all_notes_iterator(note_type=NOTE_TYPE.COMMON,
+                                                          order_by_created_at=True))
+    assert set(n.id for n in notes) <= ids
+
+    client.post_objects(delete=leads)
+
+
+def test_all_notes_order(offline_client):
+    Note = namedtuple('Note', 'id created_at')
+    notes = {ELEMENT_TYPE.CONTACT: [Note(3, 30), Note(1, 10)],
+             ELEMENT_TYPE.LEAD: [Note(2, 20), Note(5, 5), Note(4, 20)]}
+    client = offline_client
+    client.get_notes_iterator = lambda element_type, **filters: iter(notes.get(element_type, ()))
+
+    # Not ordered api results are sorted
+    ordered = list(client.get_all_notes_iterator(order_by_created_at=True, workers=2))
+    assert [note.id for note in ordered] == [5, 1, 2, 4, 3]
+    assert sorted(client.get_all_notes_iterator(workers=1)) == sorted(ordered)
+
+
+def test_mass_delete(client):
+    leads = [client.lead(name='__TEST_LEAD%s' % i) for i in range(5)]
+    client.post_objects(leads)
+
+    ids = [lead.id for lead in leads]
+    results = client.mass_delete('leads', iter(ids), chunk_size=2)
+    assert sorted(id for chunk, error in results for id in chunk) == sorted(ids)
+    assert all(error is None for chunk, error in results)
+    assert len(client.lead.get(id=ids)) == 0
+
+
+def test_mass_delete_all(offline_client):
+    client = offline_client
+    client.get_leads_iterator = lambda **filters: iter([{'id': 1}, {'id': 2}])
+    client._ajax_delete_objects = lambda model, ids, retry: SimpleNamespace(
+        data=SimpleNamespace(status='success')
+    )
+    # Not deleting all entities by mistake
+    for filters in ({}, {'query': None, 'responsible_user_id': []}):
+        with pytest.raises(ValueError):
+            client.mass_delete('leads', **filters)
+    results = client.mass_delete('leads', delete_all=True, chunk_size=1)
+    assert results == [([1], None), ([2], None)]
+
+
+def test_compact_objects(client):
+    contact = client.contact(name='__TEST_COMPACT', tags=['x'])
+    contact.phone = {'WORK': '+79001234567'}
+    contact.save()
+
+    client.compact_objects = True
+    compact = client.contact.get_one(id=contact.id)
+    assert isinstance(compact, client.contact.get_compact_cls())
+    assert not hasattr(compact, '__dict__')
+    assert compact.name == '__TEST_COMPACT'
+    assert compact.phone.getall('WORK') == ['+79001234567']
+    assert compact.responsible_user is client.current_user
+    assert compact.dump()['custom_fields'] == contact.dump()['custom_fields']
+
+    compact.name = '__TEST_COMPACT2'
+    compact.save()
+    contact.get()
+    assert contact.name == '__TEST_COMPACT2'
+    compact.delete()
+
+
+def test_lazy_objects(client):
+    contact = client.contact(name='__TEST_LAZY')
+    contact.phone = {'WORK': '+79001234567'}
+    contact.email = {'WORK': 'lazy@example.com'}
+    contact.save()
+
+    client.lazy_objects = True
+    lazy = client.contact.get_one(id=contact.id)
+    assert isinstance(lazy, client.contact)
+    assert 'name' not in lazy.__dict__
+    assert lazy.name == '__TEST_LAZY'
+    assert lazy.phone.getall('WORK') == ['+79001234567']
+
+    lazy.name = '__TEST_LAZY2'
+    lazy.save()
+    contact.get()
+    assert contact.name == '__TEST_LAZY2'
+    assert contact.email.getall('WORK') == ['lazy@example.com']
+    lazy.delete()
+
+
+def test_upsert_objects(client):
+    from amocrm_api.hashing import HashStore
+
+    store = HashStore()
+    contacts = [client.contact(name='__TEST_UPSERT%s' % i) for i in range(3)]
+    resps, skipped = client.upsert_objects(contacts, store)
+    assert resps and not skipped
+    assert all(contact.id for contact in contacts)
+
+    contacts[0].name = '__TEST_UPSERT_CHANGED'
+    resps, skipped = client.upsert_objects(contacts, store)
+    assert len(resps) == 1 and skipped == contacts[1:]
+    assert client.contact.get_one(id=contacts[0].id).name == '__TEST_UPSERT_CHANGED'
+
+    client.post_objects(delete=contacts)
+
+
+def test_search(client):
+    contacts = [client.contact(name='__TEST_SEARCH%s' % i) for i in range(2)]
+    client.post_objects(contacts)
+
+    terms = ['__TEST_SEARCH0', '__TEST_SEARCH', '__TEST_SEARCH_NOTHING']
+    rv = client.search('contacts', terms, cache_seconds=0)
+    assert [c.id for c in rv['__TEST_SEARCH0']] == [contacts[0].id]
+    assert {c.id for c in rv['__TEST_SEARCH']} >= {c.id for c in contacts}
+    assert rv['__TEST_SEARCH0'][0] in rv['__TEST_SEARCH']  # same object
+    assert rv['__TEST_SEARCH_NOTHING'] == []
+
+    client.post_objects(delete=contacts)
+
+
+def test_search_cache(offline_client):
+    client = offline_client
+    queries = []
+
+    def get_leads_iterator(query, **filters):
+        queries.append(query)
+        return iter([{'id': 1, 'name': 'Lead'}])
+    client.get_leads_iterator = get_leads_iterator
+
+    rv = client.search('leads', ['a', 'b'])
+    assert rv['a'][0] is rv['b'][0]
+    rv['a'][0].name = 'Changed'
+
+    # Cached results are not changed by callers
+    rv = client.search('leads', ['a'])
+    assert rv['a'][0].name == 'Lead'
+    assert sorted(queries) == ['a', 'b']
+
+    # Terms may be iterator
+    rv = client.search('leads', iter(['b', 'c']))
+    assert [lead.id for lead in rv['c']] == [1] and rv['b'][0] is rv['c'][0]
+    assert sorted(queries) == ['a', 'b', 'c']
+
+
+def test_date_filters(client):
+    from datetime import timedelta
+    from requests_client.utils import utcnow
+
+    lead = client.lead(name='__TEST_DATE_FILTERS')
+    lead.save()
+    lead.get()
+
+    since = lead.created_at - timedelta(seconds=1)
+    ids = [obj.id for obj in client.lead.get(datetimes_create=(since, None))]
+    assert lead.id in ids
+    assert lead.id not in [obj.id for obj in client.lead.get(
+        datetimes_modify=(None, since - timedelta(days=1))
+    )]
+    lead.delete()
+
+    # Customer model has no fields to create it with save()
+    today = utcnow().date()
+    resp = client.post('customers', json={'add': [{
+        'name': '__TEST_DATE_FILTERS', 'responsible_user_id': client.current_user.id,
+        'next_date': int(utcnow().timestamp()) + 86400,
+    }]})
+    customer_id = resp.data['_embedded']['items'][0]['id']
+
+    def get_customers_ids(**filters):
+        return [obj.id for obj in client.customer.get(
+            responsible_user_id=client.current_user.id, **filters
+        )]
+    assert customer_id in get_customers_ids(next_dates=(today, None))
+    assert customer_id not in get_customers_ids(next_dates=(None, today - timedelta(days=1)))
+    assert customer_id in get_customers_ids(datetimes_create=(today, None))
+    assert customer_id not in get_customers_ids(
+        datetimes_modify=(None, today - timedelta(days=1))
+    )
+    client.post('customers', json={'delete': [customer_id]})
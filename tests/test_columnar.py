@@ -0,0 +1,20 @@
+import pytest
+
+from amocrm_api.columnar import ColumnarBuilder
+
+
+def test_columnar_builder(client):
+    pd = pytest.importorskip('pandas')
+
+    contact = client.contact(name='__TEST_CONTACT', phone={'WORK': '+71234567890'})
+    client.post_objects([contact])
+
+    builder = ColumnarBuilder(client.contact, columns=['id', 'name', 'created_at', 'phone'])
+    builder.extend(client.get_contacts_iterator(id=[contact.id]))
+    df = builder.to_pandas()
+    assert list(df['id']) == [contact.id]
+    assert df['phone_WORK'][0] == '+71234567890'
+    assert isinstance(df['created_at'].dtype, pd.DatetimeTZDtype)
+    assert builder.to_numpy()['name'][0] == '__TEST_CONTACT'
+
+    client.post_objects(delete=[contact])
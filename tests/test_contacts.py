@@ -0,0 +1,30 @@
+from amocrm_api.contacts import find_or_create_contacts, ContactIndex, normalize_phone
+
+
+def test_normalize_phone():
+    assert normalize_phone('8 (900) 123-45-67') == normalize_phone('+79001234567')
+    assert normalize_phone('') is None
+
+
+def test_find_or_create_contacts(client):
+    existing = client.contact(name='__TEST_FIND1')
+    existing.phone = {'WORK': '+7 900 000-00-01'}
+    existing.save()
+
+    records = {}
+    for key, phone in (('existing', '89000000001'), ('new', '+79000000002'),
+                       ('new_alias', '8 900 000 00 02')):
+        records[key] = client.contact(name='__TEST_FIND_%s' % key)
+        records[key].phone = {'WORK': phone}
+
+    rv = find_or_create_contacts(client, records)
+    assert rv.ids['existing'] == existing.id
+    assert rv.created == {'new'}
+    assert rv.ids['new_alias'] == rv.ids['new'] == records['new'].id
+    assert not rv.ambiguous and not rv.errors
+
+    index = ContactIndex.load(client, query='__TEST_FIND')
+    rv = find_or_create_contacts(client, {'x': records['new_alias']}, index=index)
+    assert rv.ids == {'x': records['new'].id} and not rv.created
+
+    client.post_objects(delete=[existing, records['new']])
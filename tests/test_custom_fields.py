@@ -1,10 +1,11 @@
 import uuid
 
 import pytest
+from marshmallow import ValidationError
 
 from amocrm_api.models import Contact
 from amocrm_api.constants import FIELD_TYPE, ELEMENT_TYPE
-from amocrm_api.custom_fields import CUSTOM_FIELD_MAP
+from amocrm_api.custom_fields import CUSTOM_FIELD_MAP, create_custom_field
 
 
 @pytest.mark.parametrize('field_type,value', (
@@ -32,3 +33,20 @@ def test_custom_fields(client, field_type, value):
     assert m2.my_field == m1.my_field
     assert m2.custom_fields[field.metadata['id']] == m1.my_field
     assert m2.custom_fields[field.metadata['name']] == m1.my_field
+
+
+@pytest.mark.parametrize('field_type,valid,invalid', (
+    (FIELD_TYPE.SELECT, 'B', 'A'),
+    (FIELD_TYPE.MULTISELECT, ['B'], ['B', 'C']),
+    (FIELD_TYPE.MULTITEXT, {'B': 'x'}, {'A': 'x'}),
+))
+def test_enums_index(field_type, valid, invalid):
+    # Enum with duplicated name fails only on usage
+    field = create_custom_field({'id': 1, 'name': 'Field', 'field_type': field_type,
+                                 'enums': {'1': 'A', '2': 'A', '3': 'B'}})
+    assert field.get_enum_id('B') == 3
+    assert field._serialize(valid, 'field', None)
+    with pytest.raises(ValidationError):
+        field._serialize(invalid, 'field', None)
+    if field_type == FIELD_TYPE.MULTITEXT:
+        assert field._deserialize([{'enum': '3', 'value': 'x'}], 'field', {}) == {'B': 'x'}
@@ -0,0 +1,19 @@
+from amocrm_api.graph import RelationGraph
+
+
+def test_relation_graph(client):
+    contact = client.contact(name='__TEST_CONTACT')
+    client.post_objects([contact])
+    lead = client.lead(name='__TEST_LEAD', contacts=[contact])
+    client.post_objects([lead])
+
+    graph = RelationGraph.load(client)
+    assert contact.id in graph.neighbors('lead', lead.id, 'contacts')
+    assert lead.id in graph.neighbors('lead', contact.id, 'contacts', reverse=True)
+
+    lead.contacts = []
+    client.post_objects([lead])
+    graph.update_from_client(client)
+    assert contact.id not in graph.neighbors('lead', lead.id, 'contacts')
+
+    client.post_objects(delete=[lead, contact])
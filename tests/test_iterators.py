@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from collections import namedtuple
+from types import SimpleNamespace
+
+from requests.exceptions import Timeout
+from requests_client.exceptions import HTTPError
+
+from amocrm_api.iterators import AdaptivePageSize, ObjectsFetchIterator
+
+
+def test_iterator_token(client):
+    contacts = [client.contact(name='__TEST_CONTACT%s' % i) for i in range(3)]
+    client.post_objects(contacts)
+
+    ids = [c.id for c in contacts]
+    iterator = client.get_contacts_iterator(id=ids, cursor_count=2)
+    first = next(iterator)
+    token = iterator.token
+
+    rest = list(client.get_iterator_from_token(token))
+    assert sorted([first.id] + [c.id for c in rest]) == sorted(ids)
+    assert len(list(iterator)) == len(rest)
+
+    client.post_objects(delete=contacts)
+
+
+def test_iterator_consistent(client):
+    contacts = [client.contact(name='__TEST_CONTACT%s' % i) for i in range(5)]
+    client.post_objects(contacts[:3])
+
+    iterator = client.get_contacts_iterator(cursor_count=2, consistent=True)
+    ids = [next(iterator).id for _ in range(2)]
+    # Entities removed and added while iteration is in progress
+    client.post_objects(contacts[3:], delete=[contacts[0]])
+    ids += [c.id for c in iterator]
+
+    assert len(ids) == len(set(ids))
+    assert set(c.id for c in contacts[1:]) <= set(ids)
+
+    client.post_objects(delete=contacts[1:])
+
+
+def test_iterator_process_pool(client):
+    contacts = [client.contact(name='__TEST_CONTACT%s' % i) for i in range(5)]
+    client.post_objects(contacts)
+
+    ids = [c.id for c in contacts]
+    iterator = client.get_contacts_iterator(id=ids, cursor_count=2, process_pool=2)
+    loaded = list(iterator)
+    assert [c.id for c in loaded] == [c.id for c in client.get_contacts(id=ids).data]
+    assert all(c.client is client for c in loaded)
+
+    # Pools are shut down on early exit
+    with client.get_contacts_iterator(id=ids, cursor_count=2, process_pool=2) as iterator:
+        next(iterator)
+    assert not iterator._finalizer.alive
+
+    client.post_objects(delete=contacts)
+
+
+def test_aiterator(client):
+    contacts = [client.contact(name='__TEST_CONTACT%s' % i) for i in range(3)]
+    client.post_objects(contacts)
+
+    ids = [c.id for c in contacts]
+
+    async def collect():
+        async with client.get_contacts_aiterator(id=ids, cursor_count=2,
+                                                 prefetch_pages=1) as iterator:
+            return [c.id async for c in iterator]
+
+    assert sorted(asyncio.run(collect())) == sorted(ids)
+
+    client.post_objects(delete=contacts)
+
+
+def test_adaptive_page_size():
+    page_size = AdaptivePageSize(target_seconds=2, min_count=10)
+    # Halving on error, within bounds
+    assert page_size.failed(400) == 200
+    assert page_size.failed(15) == 10
+    assert page_size.is_retryable(Timeout())
+    assert not page_size.is_retryable(ValueError())
+    assert page_size.is_retryable(HTTPError(SimpleNamespace(status_code=503)))
+    assert not page_size.is_retryable(HTTPError(SimpleNamespace(status_code=429)))
+
+    # Growth of fast pages is limited by max_growth and max_count
+    assert page_size.update(100, 100, 0.01, 0) == 150
+    assert page_size.update(400, 400, 0.01, 0) == 500
+    # Slow pages are decreased
+    assert page_size.update(500, 500, 10, 0) == 300
+    assert page_size.update(10, 10, 100, 0) == 10
+    # Nothing fetched, nothing to estimate
+    assert page_size.update(100, 0, 1, 0) == 100
+
+    assert AdaptivePageSize(max_bytes=1000).update(100, 100, 0.01, 100 * 100) == 55
+    assert AdaptivePageSize(max_count=1000).max_count == 500
+
+
+Entity = namedtuple('Entity', 'id')
+
+
+class FakeClient:
+    logger = logging.getLogger('amocrm_api.tests')
+
+    def __init__(self, count, max_rows=500):
+        self.entities = [Entity(id) for id in range(1, count + 1)]
+        self.max_rows = max_rows
+        self.calls = []
+
+    def get_leads(self, cursor=0, cursor_count=500):
+        self.calls.append(cursor_count)
+        if cursor_count > self.max_rows:
+            raise Timeout()
+        return SimpleNamespace(data=self.entities[cursor:cursor + min(cursor_count, 500)],
+                               content=b'')
+
+
+def test_iterator_page_size():
+    client = FakeClient(1200, max_rows=300)
+    iterator = ObjectsFetchIterator(client, 'leads', page_size=True, consistent=True,
+                                    delta_pass=False)
+    assert [obj.id for obj in iterator] == list(range(1, 1201))
+    # Page size is halved on error, overlap is included in api maximum
+    assert client.calls[:2] == [500, 250]
+    assert max(client.calls) <= 500
+
+    client = FakeClient(1200)
+    assert len(list(ObjectsFetchIterator(client, 'leads', consistent=True,
+                                         delta_pass=False))) == 1200
+    assert client.calls == [500, 500, 500]
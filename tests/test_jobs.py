@@ -0,0 +1,19 @@
+from amocrm_api.jobs import JobQueue, JobRunner, offset_units, partition_units, DONE
+
+
+def test_job_runner(client, tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), max_account_units=2)
+    queue.add_job('offsets', client.auth_ident,
+                  offset_units('contacts', window=100, windows=3, cursor_count=50))
+    queue.add_job('partitions', client.auth_ident,
+                  partition_units('contacts', 'responsible_user_id', sorted(client.users)))
+
+    ids = {'offsets': set(), 'partitions': set()}
+    JobRunner(queue, lambda auth_ident: client,
+              lambda client, unit, obj: ids[unit.job].add(obj.id), workers=2).run()
+
+    assert queue.get_stats() == {DONE: 3 + len(client.users)}
+    assert queue.is_finished()
+    # Entities of deleted users are not matched by responsible_user_id partitions
+    assert ids['partitions'] <= ids['offsets']
+    assert not queue.claim('worker')
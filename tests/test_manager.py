@@ -0,0 +1,165 @@
+from threading import Event, Lock
+from time import sleep
+
+import pytest
+
+from amocrm_api import models
+from amocrm_api.manager import AmocrmClientManager, BULK
+
+
+# Accounts have different ids of same custom fields
+FIELD_IDS_OFFSETS = {'first:one': 0, 'second:two': 10}
+
+
+@pytest.fixture()
+def create_client(offline_client_factory):
+    def create_client(auth_ident):
+        return offline_client_factory(auth_ident,
+                                      field_ids_offset=FIELD_IDS_OFFSETS[auth_ident])
+    return create_client
+
+
+def load_contact(client, position):
+    field_id = FIELD_IDS_OFFSETS[client.auth_ident] + 3
+    return client.contact.load({'id': 1, 'name': 'Contact', 'custom_fields': [
+        {'id': field_id, 'values': [{'value': position}]},
+    ]})
+
+
+def test_bind_model_isolated(create_client):
+    first, second = create_client('first:one'), create_client('second:two')
+    assert first.contact is not second.contact
+    assert issubclass(first.contact, models.SystemContact)
+    assert first.contact.client is first and second.contact.client is second
+    assert models.SystemContact._client is None
+
+    first_contact = load_contact(first, 'CEO')
+    second_contact = load_contact(second, 'CTO')
+    assert first_contact.client is first and second_contact.client is second
+    assert (first_contact.position, second_contact.position) == ('CEO', 'CTO')
+
+    # Binding of second client custom fields is not applied to first client models
+    first_contact = load_contact(first, 'CFO')
+    assert first_contact.position == 'CFO'
+    assert [v['id'] for v in first_contact.dump()['custom_fields']] == [3]
+    assert [v['id'] for v in second_contact.dump()['custom_fields']] == [13]
+
+
+def test_bind_model_class(create_client):
+    client = create_client('first:one')
+
+    class MyContact(models.SystemContact):
+        pass
+    assert client.bind_model(MyContact) is MyContact
+    assert MyContact.client is client and client.contact is MyContact
+    assert load_contact(client, 'CEO').position == 'CEO'
+
+
+def test_manager_clients(create_client):
+    manager = AmocrmClientManager(create_client, workers=2)
+    try:
+        futures = {auth_ident: manager.submit(auth_ident, lambda client: client.contact)
+                   for auth_ident in FIELD_IDS_OFFSETS}
+        models_ = {auth_ident: future.result() for auth_ident, future in futures.items()}
+        assert models_['first:one'] is not models_['second:two']
+        for auth_ident, model in models_.items():
+            assert model.client is manager.get_client(auth_ident)
+            assert model.client.auth_ident == auth_ident
+    finally:
+        manager.close()
+
+
+def test_manager_ratelimit(create_client):
+    manager = AmocrmClientManager(create_client, workers=1)
+    try:
+        first, second = map(manager.get_client, FIELD_IDS_OFFSETS)
+        assert first.ratelimiter is not second.ratelimiter
+        assert first.ratelimiter.rate == first.concurrent_ratelimit
+    finally:
+        manager.close()
+
+
+def submit_blocking(manager, auth_ident):
+    # Occupies worker until returned event is set
+    started, release = Event(), Event()
+    manager.submit(auth_ident, lambda client: started.set() or release.wait(5))
+    assert started.wait(5)
+    return release
+
+
+def test_manager_scheduling(create_client):
+    manager = AmocrmClientManager(create_client, workers=1)
+    calls = []
+
+    def call(client, value):
+        calls.append(value)
+
+    try:
+        release = submit_blocking(manager, 'first:one')
+        futures = [manager.submit(auth_ident, call, (auth_ident, i), priority=BULK)
+                   for auth_ident, count in (('first:one', 3), ('second:two', 2))
+                   for i in range(count)]
+        futures.append(manager.submit('second:two', call, 'interactive'))
+        release.set()
+        for future in futures:
+            future.result(5)
+    finally:
+        manager.close()
+    # Interactive calls go first, accounts are served round-robin
+    assert calls == ['interactive', ('first:one', 0), ('second:two', 0), ('first:one', 1),
+                     ('second:two', 1), ('first:one', 2)]
+
+
+def test_manager_max_account_workers(create_client):
+    manager = AmocrmClientManager(create_client, workers=4, max_account_workers=2)
+    release, lock = Event(), Lock()
+    running = {'count': 0, 'max': 0}
+
+    def call(client):
+        with lock:
+            running['count'] += 1
+            running['max'] = max(running['max'], running['count'])
+        release.wait(5)
+        with lock:
+            running['count'] -= 1
+
+    try:
+        futures = [manager.submit('first:one', call) for _ in range(4)]
+        for _ in range(50):
+            if running['count'] == 2:
+                break
+            sleep(0.1)
+        # Other account is not blocked by busy one
+        assert manager.call('second:two', lambda client: client.auth_ident) == 'second:two'
+        assert running == {'count': 2, 'max': 2}
+        release.set()
+        for future in futures:
+            future.result(5)
+        assert running['max'] == 2
+    finally:
+        manager.close()
+
+
+def test_manager_max_clients(create_client):
+    created = []
+
+    def client_factory(auth_ident):
+        created.append(auth_ident)
+        return create_client(auth_ident)
+
+    manager = AmocrmClientManager(client_factory, workers=1, max_clients=1)
+    try:
+        # Least recently used idle client is evicted
+        manager.get_client('first:one')
+        manager.get_client('second:two')
+        first = manager.get_client('first:one')
+        assert created == ['first:one', 'second:two', 'first:one']
+
+        # Busy client is not evicted
+        release = submit_blocking(manager, 'first:one')
+        manager.get_client('second:two')
+        assert manager.get_client('first:one') is first
+        assert created == ['first:one', 'second:two', 'first:one', 'second:two']
+        release.set()
+    finally:
+        manager.close()
@@ -0,0 +1,131 @@
+from collections import namedtuple
+from itertools import count
+from threading import Thread
+from time import monotonic, sleep
+
+import pytest
+
+from requests_client.client import BaseClient
+
+from amocrm_api.parallel import RateLimiter, iterate_concurrently
+
+
+Entity = namedtuple('Entity', 'id')
+
+
+def test_ratelimiter():
+    limiter = RateLimiter(5, period=0.5)
+    started_at = monotonic()
+    assert limiter.acquire() <= 0
+    assert all(limiter.acquire() > 0 for _ in range(4))
+    assert monotonic() - started_at >= 0.39
+
+    # Burst of rate requests after idle period
+    sleep(0.6)
+    assert all(limiter.acquire() <= 0 for _ in range(5))
+    assert limiter.acquire() > 0
+
+
+def test_ratelimiter_threads():
+    limiter = RateLimiter(20)
+    threads = [Thread(target=lambda: [limiter.acquire() for _ in range(2)])
+               for _ in range(5)]
+    started_at = monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert monotonic() - started_at >= 0.44
+
+
+def test_iterate_concurrently():
+    iterables = [range(i * 100, i * 100 + 50) for i in range(4)]
+    items = list(iterate_concurrently(iterables, workers=2, queue_size=10))
+    assert sorted(items) == sorted(item for iterable in iterables for item in iterable)
+    # Items of every iterable are yielded in its order
+    for iterable in iterables:
+        assert [item for item in items if item in iterable] == list(iterable)
+
+
+def test_iterate_concurrently_error():
+    counts = [0]
+
+    def endless():
+        while True:
+            counts[0] += 1
+            yield counts[0]
+
+    def failing():
+        yield -1
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        list(iterate_concurrently([endless(), failing()], queue_size=2))
+    sleep(0.3)
+    count = counts[0]
+    sleep(0.3)
+    assert counts[0] == count
+
+
+def test_iterate_concurrently_close():
+    counts = [0, 0]
+
+    def endless(i):
+        while True:
+            counts[i] += 1
+            yield i
+
+    iterator = iterate_concurrently([endless(0), endless(1)], queue_size=2)
+    assert next(iterator) in (0, 1)
+    iterator.close()
+    sleep(0.3)
+    stopped_counts = list(counts)
+    sleep(0.3)
+    assert counts == stopped_counts
+
+
+def test_partitioned_iterator(offline_client):
+    client = offline_client
+    assert client.ratelimiter is None
+    partitions = {1: [Entity(1), Entity(2)], 2: [Entity(3)], 3: [], 4: [Entity(2)]}
+    calls = []
+
+    def get_leads_iterator(status_id, cursor_count):
+        calls.append(status_id)
+        return iter(partitions[status_id])
+
+    client.get_leads_iterator = get_leads_iterator
+    leads = list(client.get_partitioned_iterator('leads', partitions=sorted(partitions)))
+    # Entity matched by many partitions is yielded once
+    assert sorted(lead.id for lead in leads) == [1, 2, 3]
+    assert sorted(calls) == [1, 2, 3, 4]
+    # Concurrent requests are limited even if client ratelimit is not set
+    assert client.ratelimiter.rate == client.concurrent_ratelimit == 7
+
+    with pytest.raises(ValueError):
+        list(client.get_partitioned_iterator('contacts', partition_by='status_id'))
+
+
+def test_partitioned_iterator_ratelimit(monkeypatch, offline_client_factory):
+    monkeypatch.setattr(BaseClient, '_send_request', lambda self, *args, **kwargs: None)
+    client = offline_client_factory()
+    client.concurrent_ratelimit = 20
+    ids = count()
+
+    def get_leads_iterator(status_id, cursor_count):
+        for _ in range(3):
+            client._request('GET', 'leads')
+            yield Entity(next(ids))
+
+    client.get_leads_iterator = get_leads_iterator
+    started_at = monotonic()
+    leads = list(client.get_partitioned_iterator('leads', partitions=range(10), workers=10))
+    assert len(leads) == 30
+    # Burst of 20 requests, 10 requests more with 20 per second
+    assert monotonic() - started_at >= 0.45
+
+    # Explicitly disabled
+    client = offline_client_factory(ratelimit=0)
+    client.get_leads_iterator = get_leads_iterator
+    list(client.get_partitioned_iterator('leads', partitions=range(10), workers=10))
+    assert client.ratelimiter is None
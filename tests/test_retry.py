@@ -0,0 +1,101 @@
+from datetime import timedelta
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+from requests.exceptions import ReadTimeout
+from requests_client.utils import utcnow
+
+from amocrm_api.retry import RetryPolicy
+
+
+def error(retry_after=None):
+    headers = {'Retry-After': retry_after} if retry_after is not None else {}
+    exc = ReadTimeout()
+    exc.resp = SimpleNamespace(headers=headers)
+    return exc
+
+
+def test_retry_policy_wait_seconds():
+    policy = RetryPolicy(retries=3, backoff_seconds=1, backoff_factor=2,
+                         max_backoff_seconds=5, jitter=0)
+    assert [policy.get_wait_seconds(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+
+    policy.jitter = 0.5
+    for _ in range(100):
+        assert 1 <= policy.get_wait_seconds(2) <= 2
+
+    assert policy.should_retry(ReadTimeout(), 2)
+    assert not policy.should_retry(ReadTimeout(), 3)
+    assert not policy.should_retry(ValueError(), 0)
+
+
+def test_retry_policy_retry_after():
+    policy = RetryPolicy(max_backoff_seconds=60, jitter=0)
+    assert policy.get_retry_after(error('7')) == 7
+    assert policy.get_wait_seconds(1, error('7')) == 7
+    # Limited by max_backoff_seconds
+    assert policy.get_wait_seconds(1, error('600')) == 60
+
+    retry_at = format_datetime(utcnow() + timedelta(seconds=30), usegmt=True)
+    assert 28 <= policy.get_retry_after(error(retry_at)) <= 30
+    retry_at = format_datetime(utcnow() - timedelta(seconds=30), usegmt=True)
+    assert policy.get_retry_after(error(retry_at)) == 0
+
+    # Invalid or missing header, backoff is used
+    assert policy.get_retry_after(error('soon')) is None
+    assert policy.get_retry_after(error()) is None
+    assert policy.get_wait_seconds(1, error('soon')) == 1
+
+
+@pytest.fixture()
+def offline_client(offline_client_factory):
+    return offline_client_factory(
+        custom_fields={'leads': {'100': {'id': 100, 'name': 'Marker', 'code': None,
+                                         'field_type': 1, 'enums': None}}},
+        retry_policy=RetryPolicy(backoff_seconds=0),
+    )
+
+
+def test_post_retry_added(offline_client):
+    client = offline_client
+    client.add_marker_field = 'Marker'
+    server, posted = {}, []
+
+    def post(url, json):
+        posted.append(json['add'])
+        if len(posted) == 1:
+            # First entity is added, but response is lost
+            server[100] = json['add'][0]
+            raise ReadTimeout()
+        return SimpleNamespace(data={'_embedded': {'items': [{'id': 101}]}})
+
+    def get_leads_iterator(modified_since):
+        return iter([dict(data, id=id) for id, data in server.items()])
+
+    client.post = post
+    client.get_leads_iterator = get_leads_iterator
+    leads = [client.lead(name='Lead'), client.lead(name='Lead')]
+    client.post_objects(leads)
+
+    assert [lead.id for lead in leads] == [100, 101]
+    # Only not found entity is added again, every add has own marker
+    assert len(posted) == 2 and len(posted[1]) == 1
+    markers = [data['custom_fields'][-1]['values'][0]['value'] for data in posted[0]]
+    assert len(set(markers)) == 2
+
+
+def test_post_retry_without_marker(offline_client):
+    client = offline_client
+    posted = []
+
+    def post(url, json):
+        posted.append(json)
+        raise ReadTimeout()
+
+    client.post = post
+    with pytest.raises(ReadTimeout):
+        client.post_objects([client.lead(name='Lead')])
+    # Adding may be not safe to retry without marker
+    assert len(posted) == 1
+    assert not posted[0]['add'][0]['custom_fields']
@@ -0,0 +1,28 @@
+import pytest
+
+from amocrm_api import serialization
+
+
+@pytest.mark.parametrize('use_msgpack', (True, False))
+def test_dumps_loads(client, use_msgpack):
+    if use_msgpack:
+        pytest.importorskip('msgpack')
+    contact = client.contact(name='__TEST_CONTACT', phone={'WORK': '+71234567890'})
+    client.post_objects([contact])
+    contact.get()
+
+    data = serialization.dumps([contact], use_msgpack=use_msgpack)
+    loaded = serialization.loads(data, client)
+    assert loaded[0].client is client
+    assert loaded[0].dump() == contact.dump()
+    assert loaded[0].phone == contact.phone
+
+    client.post_objects(delete=[contact])
+
+
+def test_dumps_without_msgpack(monkeypatch):
+    monkeypatch.setattr(serialization, 'msgpack', None)
+    with pytest.raises(RuntimeError):
+        serialization.dumps([1], use_msgpack=True)
+    data = serialization.dumps([1, ('a', None)])
+    assert serialization.loads(data, None) == [1, ('a', None)]